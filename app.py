@@ -1,7 +1,21 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import os
+import json
 import tempfile
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
+from config import Config
+from services.executor import get_executor
+from services.file_serving import FileServer
+from services.job_handlers import register_media_handlers
+from services.job_manager import JobManager
+from services.job_queue import create_job_queue
+from services.job_store import JobStore
+from services.scheduler import PRIORITY_PROBE
+from services.storage_manager import get_storage_manager
+from services.stream_proxy import StreamProxy
+from services.video_downloader import sanitize_filename
+from services.zip_stream import stream_zip, unique_arcnames
 from services.video_downloader import VideoDownloader
 from services.bgm_extractor import BGMExtractor
 from services.thumbnail_extractor import ThumbnailExtractor
@@ -21,6 +35,34 @@ bgm_extractor = BGMExtractor()
 
 thumbnail_extractor = ThumbnailExtractor()
 
+# 边下边传，缓存写入使用视频下载的临时目录
+stream_proxy = StreamProxy(video_downloader.temp_dir, Config.STREAM_TEE_QUEUE_SIZE)
+
+# 文件发送方式，可交给前端代理（X-Sendfile / X-Accel-Redirect）发送
+file_server = FileServer(Config.FILE_SERVE_BACKEND, Config.X_ACCEL_LOCATIONS)
+
+# 临时目录由各服务自行纳入配额管理，这里补充下载目录
+storage_manager = get_storage_manager()
+storage_manager.add_directory(Config.DOWNLOAD_BASE_DIR, Config.DOWNLOAD_DIR_QUOTA_BYTES)
+
+# 异步任务管理器，任务状态持久化到SQLite；队列后端为sqlite时由 worker.py 进程执行
+job_queue = create_job_queue(
+    Config.JOB_QUEUE_BACKEND, Config.JOB_DB_PATH,
+    lease_seconds=Config.WORKER_LEASE_SECONDS, aging_seconds=Config.PRIORITY_AGING_SECONDS
+)
+job_manager = JobManager(JobStore(Config.JOB_DB_PATH), job_queue, retention_seconds=Config.JOB_RETENTION_SECONDS)
+register_media_handlers(job_manager, video_downloader, bgm_extractor, thumbnail_extractor)
+
+def start_background_tasks(debug: bool):
+    """恢复未完成的任务并启动存储配额管理；调试模式下只在重载器的子进程中执行，避免重复执行"""
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_manager.resume()
+        storage_manager.start()
+
+def run_probe(func, *args, **kwargs):
+    """以最高优先级在共享线程池中执行元数据探测，不被排队中的下载任务阻塞"""
+    return get_executor().submit(func, *args, priority=PRIORITY_PROBE, **kwargs).result()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -42,8 +84,8 @@ def download_videos():
         if not urls:
             return jsonify({'error': '请提供有效的视频URL'}), 400
         
-        results = video_downloader.download_batch(urls)
-        return jsonify({'results': results})
+        job = job_manager.submit('download', urls)
+        return jsonify(job.to_dict()), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -59,8 +101,8 @@ def extract_bgm():
         if not urls:
             return jsonify({'error': '请提供有效的视频URL'}), 400
         
-        results = bgm_extractor.extract_batch(urls)
-        return jsonify({'results': results})
+        job = job_manager.submit('bgm', urls)
+        return jsonify(job.to_dict()), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -77,12 +119,98 @@ def extract_thumbnail():
         if not urls:
             return jsonify({'error': '请提供有效的视频URL'}), 400
         
-        results = thumbnail_extractor.extract_batch(urls, timestamp)
-        return jsonify({'results': results})
+        job = job_manager.submit('thumbnail', urls, params={'timestamp': timestamp})
+        return jsonify(job.to_dict()), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """查询任务状态"""
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """获取任务结果，任务未完成时返回202"""
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if not job.is_finished:
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.to_dict(include_results=True))
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务，请求体中提供index时只取消对应的URL"""
+    data = request.get_json(silent=True) or {}
+    item_index = data.get('index')
+
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if item_index is not None and not (isinstance(item_index, int) and 0 <= item_index < len(job.items)):
+        return jsonify({'error': '无效的子项序号'}), 400
+
+    job = job_manager.cancel(job_id, item_index)
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """以Server-Sent Events推送任务中每个URL的实时进度"""
+    if job_manager.get_job(job_id) is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+
+    def generate():
+        for event in job_manager.watch(job_id):
+            if event is None:
+                # 保活注释，防止代理断开空闲连接
+                yield ': keepalive\n\n'
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/jobs/<job_id>/archive', methods=['GET'])
+def download_job_archive(job_id):
+    """
+    把任务中所有成功的产物打包为一个ZIP下载
+
+    压缩包边读文件边生成，条目不重新压缩，一次请求代替逐个调用 /api/download_temp_file。
+    """
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if not job.is_finished:
+        return jsonify({'error': '任务尚未完成'}), 409
+
+    files = []
+    for item in job.items:
+        result = item.get('result') or {}
+        path = result.get('temp_filepath') or result.get('filepath')
+        if item['status'] == 'success' and path and os.path.isfile(path):
+            storage_manager.touch(path)
+            files.append((path, result.get('download_filename')))
+    if not files:
+        return jsonify({'error': '没有可下载的文件，可能已被清理'}), 404
+
+    download_name = f"fastmedia-{job.kind}-{job_id[:8]}.zip"
+    return Response(
+        stream_with_context(stream_zip(unique_arcnames(files))),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}",
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/api/test_bilibili', methods=['POST'])
 def test_bilibili():
@@ -99,7 +227,7 @@ def test_bilibili():
 
         # 测试信息获取
         try:
-            info = video_downloader.get_video_info(url)
+            info = run_probe(video_downloader.get_video_info, url)
             return jsonify({
                 'platform_detected': platform,
                 'video_info': {
@@ -143,10 +271,9 @@ def check_bilibili_video():
 
         # 使用简单的yt-dlp命令检查视频可用性
         import subprocess
-        import json
 
         try:
-            result = subprocess.run([
+            result = run_probe(subprocess.run, [
                 'python', '-m', 'yt_dlp',
                 '--no-warnings',
                 '--no-download',
@@ -203,16 +330,39 @@ def check_bilibili_video():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/download_temp_file', methods=['POST'])
+def artifact_etag(filepath):
+    """产物的强ETag：使用登记时计算的SHA-256，文件已变化（大小或修改时间不同）或未登记时返回None"""
+    artifact = job_manager.store.get_artifact(filepath)
+    if artifact is None:
+        return None
+    stat = os.stat(filepath)
+    if artifact['size'] != stat.st_size or artifact['mtime'] != stat.st_mtime:
+        return None
+    return artifact['sha256']
+
+def managed_temp_path(temp_filepath):
+    """客户端提供的文件路径，解析后位于受管的临时/下载目录内时返回真实路径，否则返回None"""
+    if not temp_filepath or not storage_manager.manages(temp_filepath):
+        return None
+    return os.path.realpath(temp_filepath)
+
+@app.route('/api/download_temp_file', methods=['GET', 'POST'])
 def download_temp_file():
-    """下载临时文件"""
+    """
+    下载临时文件
+
+    支持Range分段请求和 If-None-Match / If-Range 条件请求，断点续传和播放器拖动进度时只传输需要的部分。
+    GET方式通过查询参数传递，可直接作为 <video> 的地址或浏览器下载链接。
+    """
     try:
-        data = request.get_json()
+        data = request.args if request.method == 'GET' else request.get_json()
         temp_filepath = data.get('temp_filepath')
         download_filename = data.get('download_filename', 'video.mp4')
         file_type = data.get('file_type', 'video')  # 根据文件类型设置mimetype
 
-        if not temp_filepath or not os.path.exists(temp_filepath):
+        # 只允许访问受管目录中的文件，避免通过路径参数读取任意文件
+        real_path = managed_temp_path(temp_filepath)
+        if real_path is None or not os.path.isfile(real_path):
             return jsonify({'error': '文件不存在或已被清理'}), 404
 
         # 根据文件类型设置mimetype
@@ -223,17 +373,69 @@ def download_temp_file():
         else:
             mimetype = 'video/mp4'
 
-        
-        return send_file(
-            temp_filepath,
-            as_attachment=True,
+        storage_manager.touch(real_path)
+        return file_server.send(
+            real_path,
             download_name=download_filename,
-            mimetype=mimetype
+            mimetype=mimetype,
+            etag=artifact_etag(temp_filepath) or True
         )
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stream', methods=['GET'])
+def stream_media():
+    """
+    边下边传：视频有音视频合一的渐进式格式时，把上游数据直接转发给客户端
+
+    查询参数: url 视频链接；download=1 作为附件下载（默认内联，可直接用于 <video>）；
+    cache=0/1 是否同时写入媒体缓存。客户端的Range请求会转发给上游，支持拖动进度。
+    """
+    url = request.args.get('url', '').strip()
+    if not url:
+        return jsonify({'error': '请提供视频URL'}), 400
+
+    try:
+        stream = run_probe(stream_proxy.resolve, video_downloader.preprocess_url(url))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    as_attachment = request.args.get('download') == '1'
+    download_name = f"{stream['extractor']}-{sanitize_filename(stream['title'])}.{stream['ext']}"
+
+    # 已缓存时直接发送本地文件
+    if stream['cached'] is not None:
+        return file_server.send(
+            stream['cached']['path'],
+            download_name=download_name,
+            as_attachment=as_attachment,
+            etag=stream['cached']['sha256']
+        )
+
+    try:
+        upstream = stream_proxy.open(stream, request.headers.get('Range'))
+    except Exception as e:
+        return jsonify({'error': f'连接视频源失败: {str(e)}'}), 502
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f"{'attachment' if as_attachment else 'inline'}; filename*=UTF-8''{quote(download_name)}"
+    }
+    for name in ('Content-Length', 'Content-Range'):
+        if name in upstream.headers:
+            headers[name] = upstream.headers[name]
+
+    tee_to_cache = request.args.get('cache', '1' if Config.STREAM_TEE_TO_CACHE else '0') == '1'
+    return Response(
+        stream_with_context(stream_proxy.iter_body(stream, upstream, tee_to_cache)),
+        status=upstream.status_code,
+        mimetype=upstream.headers.get('Content-Type', 'video/mp4'),
+        headers=headers
+    )
+
 @app.route('/api/cleanup_temp_file', methods=['POST'])
 def cleanup_temp_file():
     """清理临时文件"""
@@ -243,6 +445,8 @@ def cleanup_temp_file():
         file_type = data.get('file_type', 'video')  # 'video', 'bgm' 或 'thumbnail'
 
         if temp_filepath:
+            if managed_temp_path(temp_filepath) is None:
+                return jsonify({'error': '只能清理临时目录中的文件'}), 400
             if file_type == 'bgm':
                 bgm_extractor.cleanup_temp_file(temp_filepath)
             elif file_type == 'thumbnail':
@@ -251,6 +455,7 @@ def cleanup_temp_file():
                 video_downloader.xiaohongshu_downloader.cleanup_temp_file(temp_filepath)
             else:
                 video_downloader.cleanup_temp_file(temp_filepath)
+            storage_manager.forget(temp_filepath)
             return jsonify({'status': 'success', 'message': '文件已清理'})
         else:
             return jsonify({'error': '未提供文件路径'}), 400
@@ -284,7 +489,7 @@ def check_temp_file():
 def download_file(filename):
     """下载文件（保留原有功能）"""
     try:
-        return send_file(filename, as_attachment=True)
+        return file_server.send(filename)
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
@@ -294,4 +499,5 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 if __name__ == '__main__':
+    start_background_tasks(debug=True)
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -30,12 +30,82 @@ class Config:
     THUMBNAIL_QUALITY = 90
     
     # 并发处理配置
-    MAX_CONCURRENT_DOWNLOADS = 3
+    MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', 3))
     DOWNLOAD_TIMEOUT = 300  # 5分钟
+    RESERVED_LIGHT_WORKERS = 1  # 只处理元数据探测的预留线程数
+    PRIORITY_AGING_SECONDS = 30  # 任务每等待该秒数优先级提升一级，避免重任务饿死
+    CPU_WORKERS = int(os.environ.get('CPU_WORKERS', os.cpu_count() or 1))  # 视频解码进程数
+    
+    # 平台限流配置（令牌桶）：rate为每秒请求数，burst为突发容量
+    # 平台返回429/403时自动降速，请求成功后逐步恢复
+    RATE_LIMITS = {
+        'kuaishou': {'rate': 0.5, 'burst': 2},
+        'bilibili': {'rate': 1.0, 'burst': 3},
+        'douyin/tiktok': {'rate': 1.0, 'burst': 3},
+        'xiaohongshu': {'rate': 0.5, 'burst': 2},
+        'youtube': {'rate': 2.0, 'burst': 5},
+        'default': {'rate': 2.0, 'burst': 5}
+    }
+    
+    # HTTP连接池配置：各服务共享连接，按主机（域名后缀）设置连接池大小
+    HTTP_POOL_SIZES = {
+        'kuaishou.com': 8,
+        'xiaohongshu.com': 8,
+        'bilibili.com': 8,
+        'default': 16
+    }
+    HTTP_TIMEOUT = (5, 30)  # 未指定超时的请求使用的 (连接, 读取) 超时（秒）
+    DOWNLOAD_SEGMENTS = 4  # 直链文件分段并发下载的最大连接数
+    DOWNLOAD_MIN_SEGMENT_BYTES = 4 * 1024 ** 2  # 每段最小大小，小文件不分段
+    DOWNLOAD_WRITE_BUFFER = 1024 ** 2  # 每段写入磁盘前的缓冲大小
+    # 边下边传（/api/stream）：默认同时写入媒体缓存；写盘积压超过该块数时放弃缓存，不阻塞转发
+    STREAM_TEE_TO_CACHE = True
+    STREAM_TEE_QUEUE_SIZE = 64
+    # 文件发送方式：direct 由WSGI服务器发送；x-sendfile（Apache/lighttpd）或 x-accel-redirect（nginx）交给前端代理发送
+    FILE_SERVE_BACKEND = os.environ.get('FILE_SERVE_BACKEND', 'direct')
+    # x-accel-redirect 的目录映射，格式 "本地目录=internal location前缀,..."，如 "downloads=/_protected/downloads"
+    X_ACCEL_LOCATIONS = dict(
+        item.split('=', 1) for item in os.environ.get('X_ACCEL_LOCATIONS', '').split(',') if '=' in item
+    )
+    # yt-dlp断点续传（.part 文件和 .ytdl 分片进度默认保留）的补充配置：
+    # 分片重试耗尽时中止而不是跳过，下次从 .ytdl 记录的位置续传，避免把缺片段的文件当作完整结果缓存；
+    # 续写 .part 文件被占用（如Windows上杀毒软件扫描）时多重试几次
+    YTDLP_RESUME_OPTS = {'skip_unavailable_fragments': False, 'file_access_retries': 10}
+    # YoutubeDL实例池：每种配置保留的空闲实例数，每个实例使用该次数后重建
+    YTDLP_POOL_MAX_IDLE = 4
+    YTDLP_POOL_MAX_USES = 100
+    
+    # 异步任务配置
+    JOB_RETENTION_SECONDS = 3600  # 已完成任务保留1小时
+    JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'data/jobs.db')  # 任务与产物持久化数据库
+    # 任务队列后端：local 在API进程内执行；sqlite 由独立的 worker.py 进程认领执行
+    JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'local')
+    WORKER_LEASE_SECONDS = 60  # worker超过该时间未续约，其认领的子项会被重新分配
     
     # 缓存配置
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
+    METADATA_CACHE_TTL = 600  # yt-dlp视频信息缓存有效期（秒）
+    METADATA_CACHE_SIZE = 1000  # 视频信息缓存最大条目数
+    URL_RESOLVE_CACHE_TTL = 3600  # 短链接解析结果缓存有效期（秒）
+    URL_RESOLVE_CACHE_SIZE = 5000  # 短链接解析缓存最大条目数
+    # 已知失效链接的缓存有效期（秒），按失败原因区分；网络超时、限流等临时错误不缓存
+    NEGATIVE_CACHE_TTLS = {
+        'deleted': 6 * 3600,      # 已删除/不存在
+        'private': 3600,          # 私密或需要登录
+        'region': 6 * 3600,       # 地区限制
+        'unsupported': 24 * 3600, # 不支持的链接
+    }
+    NEGATIVE_CACHE_SIZE = 5000  # 失效链接缓存最大条目数
+
+    # 存储配额：每个临时目录和下载目录的容量上限，超出时按最近访问时间淘汰文件
+    TEMP_DIR_QUOTA_BYTES = int(os.environ.get('TEMP_DIR_QUOTA_BYTES', 5 * 1024 ** 3))
+    DOWNLOAD_DIR_QUOTA_BYTES = int(os.environ.get('DOWNLOAD_DIR_QUOTA_BYTES', 5 * 1024 ** 3))
+    STORAGE_CHECK_INTERVAL = 60  # 后台配额检查间隔（秒），文件登记导致超额时立即检查
+    STORAGE_EVICT_GRACE_SECONDS = 300  # 最近访问过的文件在该时间内不会被淘汰
+    STORAGE_RECONCILE_INTERVAL = 3600  # 扫描目录、补入未登记文件（.part、残留文件等）的间隔（秒）
+    MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', 'data/media_cache')  # 已下载媒体文件缓存目录
+    MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 10 * 1024 ** 3))  # 媒体缓存容量上限，默认10GB
     
     # 日志配置
     LOG_LEVEL = 'INFO'
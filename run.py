@@ -19,9 +19,8 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-from app import app
 from config import config
-from utils import setup_logging, clean_old_files
+from utils import setup_logging
 
 def parse_arguments():
     """解析命令行参数"""
@@ -59,12 +58,6 @@ def parse_arguments():
         help='生产模式启动 (等同于 --env production)'
     )
     
-    parser.add_argument(
-        '--clean',
-        action='store_true',
-        help='启动前清理旧文件'
-    )
-    
     parser.add_argument(
         '--log-level',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -74,7 +67,7 @@ def parse_arguments():
     
     return parser.parse_args()
 
-def setup_environment(env_name: str):
+def setup_environment(app, env_name: str):
     """设置环境配置"""
     config_class = config.get(env_name, config['default'])
     app.config.from_object(config_class)
@@ -136,8 +129,12 @@ def main():
     if not check_dependencies():
         sys.exit(1)
     
+    # 在这里而不是模块顶层导入应用：媒体处理进程池以spawn方式启动子进程时会重新导入本模块，
+    # 顶层导入会在每个子进程中重复创建服务、任务数据库连接和线程池
+    from app import app, start_background_tasks
+
     # 设置环境配置
-    config_class = setup_environment(env)
+    config_class = setup_environment(app, env)
     
     # 设置日志
     setup_logging(
@@ -145,10 +142,8 @@ def main():
         log_file=config_class.LOG_FILE if hasattr(config_class, 'LOG_FILE') else None
     )
     
-    # 清理旧文件
-    if args.clean:
-        print("🧹 清理旧文件...")
-        clean_old_files('downloads', max_age_days=7)
+    # 恢复上次未完成的任务，启动存储配额管理（超出配额时自动淘汰旧文件）
+    start_background_tasks(debug)
     
     # 打印启动信息
     print_startup_info(args.host, args.port, env, debug)
@@ -1,8 +1,19 @@
 import os
-import yt_dlp
 from typing import List, Dict
 import tempfile
-import shutil
+from config import Config
+from . import progress
+from .executor import map_ordered
+from .scheduler import PRIORITY_BGM
+from .media_processing import transcode_audio
+from .media_cache import get_media_cache
+from .metadata_cache import downloaded_filepath, extract_and_download
+from .negative_cache import get_negative_cache
+from .platforms import detect_platform, canonical_key
+from .rate_limiter import get_rate_limiter
+from .single_flight import SingleFlight
+from .storage_manager import get_storage_manager
+from .ytdlp_pool import get_ytdlp_pool
 from .kuaishou_downloader import KuaishouDownloader
 
 class BGMExtractor:
@@ -13,6 +24,7 @@ class BGMExtractor:
         # 使用固定的临时目录，而不是每次创建新的
         self.temp_dir = os.path.join(tempfile.gettempdir(), 'fastmedia_bgm_temp')
         os.makedirs(self.temp_dir, exist_ok=True)
+        get_storage_manager().add_directory(self.temp_dir, Config.TEMP_DIR_QUOTA_BYTES)
 
         self.output_dir = 'downloads/bgm'  # 保留作为默认目录
         os.makedirs(self.output_dir, exist_ok=True)
@@ -20,120 +32,102 @@ class BGMExtractor:
         # 初始化快手下载器
         self.kuaishou_downloader = KuaishouDownloader('downloads/videos')
 
-        # yt-dlp配置，直接提取音频
+        # 合并同一视频的并发提取请求
+        self.single_flight = SingleFlight()
+        self.negative_cache = get_negative_cache()
+        self.media_cache = get_media_cache()
+        self.ydl_pool = get_ytdlp_pool()
+
+        # yt-dlp配置，只下载音频流；mp3转码在CPU进程池中完成，不占用下载线程
+        self.audio_quality = Config.AUDIO_QUALITY
         self.ydl_opts = {
             'format': 'bestaudio/best',
             'outtmpl': os.path.join(self.temp_dir, '%(extractor)s-%(title)s_bgm.%(ext)s'),
             'writeinfojson': False,
-            'extractaudio': True,
-            'audioformat': 'mp3',
-            'audioquality': '192',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
+            'progress_hooks': [progress.ytdlp_hook('audio')],
+            **Config.YTDLP_RESUME_OPTS,
         }
     
     def extract_batch(self, urls: List[str]) -> List[Dict]:
-        """批量提取BGM"""
-        results = []
-        
-        for url in urls:
-            try:
-                result = self.extract_single(url)
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'url': url,
-                    'status': 'error',
-                    'error': str(e),
-                    'filepath': None
-                })
-        
-        return results
+        """批量提取BGM，在共享线程池中并发执行，结果顺序与输入一致"""
+        return map_ordered(self.extract_single, urls, lambda url, e: {
+            'url': url,
+            'status': 'error',
+            'error': str(e),
+            'filepath': None
+        }, priority=PRIORITY_BGM)
     
     def extract_single(self, url: str) -> Dict:
+        """提取单个视频的BGM，同一视频的并发请求只执行一次并共享结果"""
+        key = canonical_key(url) or url
+        result = self.negative_cache.call(key, self.single_flight.do, ('bgm', key), self._extract_single, url)
+        return dict(result, url=url)
+
+    def _extract_single(self, url: str) -> Dict:
         """提取单个视频的BGM"""
         try:
             # 检测平台
-            from urllib.parse import urlparse
-            domain = urlparse(url).netloc.lower()
-            if 'kuaishou.com' in domain:
+            platform = detect_platform(url)
+            if platform == 'kuaishou':
                 # 使用专门的快手下载器进行BGM提取
                 return self.kuaishou_downloader.extract_bgm(url)
-            
-            # 使用yt-dlp直接提取音频
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                # 获取视频信息
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'unknown')
-                
-                # 清理文件名
-                safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                extractor = info.get('extractor', 'unknown')
-                output_filename = f"{extractor}-{safe_title}_bgm.mp3"
-                output_path = os.path.join(self.output_dir, output_filename)
-                
-                # 临时修改yt-dlp配置以确保输出mp3格式
-                temp_opts = self.ydl_opts.copy()
-                temp_opts['outtmpl'] = os.path.join(self.temp_dir, f"{extractor}-{safe_title}_bgm.%(ext)s")
-
-                # 下载并提取音频
-                with yt_dlp.YoutubeDL(temp_opts) as temp_ydl:
-                    temp_ydl.download([url])
-
-                # 检查文件是否存在（可能有不同的扩展名）
-                base_name = f"{extractor}-{safe_title}_bgm"
-                temp_output_path = None
-
-                for ext in ['.mp3', '.m4a', '.webm', '.ogg']:
-                    potential_path = os.path.join(self.temp_dir, base_name + ext)
-                    if os.path.exists(potential_path):
-                        if ext != '.mp3':
-                            # 重命名为mp3
-                            final_path = os.path.join(self.temp_dir, base_name + '.mp3')
-                            shutil.move(potential_path, final_path)
-                            temp_output_path = final_path
-                        else:
-                            temp_output_path = potential_path
-                        break
-
-                # 如果没有找到文件，检查是否有其他格式的文件
-                if temp_output_path is None or not os.path.exists(temp_output_path):
-                    # 查找所有可能的文件
-                    import glob
-                    pattern = os.path.join(self.temp_dir, f"{extractor}-{safe_title}_bgm.*")
-                    files = glob.glob(pattern)
-                    if files:
-                        # 使用第一个找到的文件
-                        found_file = files[0]
-                        if not found_file.endswith('.mp3'):
-                            # 重命名为mp3
-                            final_path = os.path.join(self.temp_dir, base_name + '.mp3')
-                            shutil.move(found_file, final_path)
-                            temp_output_path = final_path
-                        else:
-                            temp_output_path = found_file
-
-                # 构建建议的文件名
-                download_filename = f"{extractor}-{safe_title}_bgm.mp3"
 
-                return {
-                    'url': url,
-                    'status': 'success',
-                    'title': title,
-                    'temp_filepath': temp_output_path if temp_output_path and os.path.exists(temp_output_path) else None,
-                    'download_filename': download_filename,
-                    'filesize': os.path.getsize(temp_output_path) if temp_output_path and os.path.exists(temp_output_path) else 0,
-                    'duration': info.get('duration', 0)
-                }
+            rate_limiter = get_rate_limiter()
+
+            def use_local_video(info):
+                # 已有本地视频副本（如视频下载功能下载过）时直接从中提取音轨，不再下载音频流
+                local_video = self.media_cache.find_video(platform, info.get('id'))
+                return local_video['path'] if local_video is not None else None
+
+            # 使用yt-dlp直接提取音频，提取到的信息直接用于下载，不再重复提取；只在需要请求平台时限流
+            with self.ydl_pool.checkout(self.ydl_opts) as ydl:
+                info, local_video_path = extract_and_download(ydl, url, platform=platform, lookup=use_local_video)
+            if info is None:
+                raise Exception('无法获取视频信息')
+
+            title = info.get('title', 'unknown')
+            base_name = self._base_name(info)
+
+            # 本地视频副本，或下载的音频文件（路径以yt-dlp记录的为准）
+            temp_output_path = local_video_path or downloaded_filepath(info)
+
+            # 本地视频和非mp3格式的音频用ffmpeg转码为mp3
+            if temp_output_path and (local_video_path or not temp_output_path.endswith('.mp3')):
+                final_path = os.path.join(self.temp_dir, base_name + '.mp3')
+                progress.report('transcode')
+                transcode_audio(temp_output_path, final_path, self.audio_quality)
+                progress.report('transcode', 'finished')
+                if not local_video_path:
+                    os.remove(temp_output_path)
+                temp_output_path = final_path
+
+            # 构建建议的文件名
+            download_filename = f"{base_name}.mp3"
+            rate_limiter.report_success(platform)
+
+            return {
+                'url': url,
+                'status': 'success',
+                'title': title,
+                'temp_filepath': temp_output_path if temp_output_path and os.path.exists(temp_output_path) else None,
+                'download_filename': download_filename,
+                'filesize': os.path.getsize(temp_output_path) if temp_output_path and os.path.exists(temp_output_path) else 0,
+                'duration': info.get('duration', 0)
+            }
                 
         except Exception as e:
+            get_rate_limiter().report_result(detect_platform(url), str(e))
             raise Exception(f'BGM提取失败: {str(e)}')
     
 
     
+    @staticmethod
+    def _base_name(info: Dict) -> str:
+        """BGM文件名（不含扩展名）：提取器-清理后的标题_bgm"""
+        title = info.get('title', 'unknown')
+        safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        return f"{info.get('extractor', 'unknown')}-{safe_title}_bgm"
+
     def extract_from_local_video(self, video_path: str, output_path: str = None) -> Dict:
         """从本地视频文件提取BGM"""
         try:
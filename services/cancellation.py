@@ -0,0 +1,124 @@
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+from loguru import logger
+from yt_dlp.utils import DownloadCancelled
+
+_context = threading.local()
+
+# 等待子进程时检查取消状态的间隔（秒）
+PROCESS_POLL_INTERVAL = 0.5
+
+
+class JobCancelled(DownloadCancelled):
+    """子任务已被取消
+
+    继承 yt-dlp 的 DownloadCancelled，在 progress_hooks 中抛出时 yt-dlp 会立即中止下载。
+    """
+    msg = '任务已取消'
+
+
+class CancelToken:
+    """
+    单个子任务的取消令牌
+
+    处理线程在下一次进度上报或检查点抛出 JobCancelled，随后由任务管理器调用 cleanup()
+    删除登记的中间文件。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._paths = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """标记取消"""
+        self._event.set()
+
+    def track(self, path: str):
+        """登记子任务产生的文件，取消后需要删除"""
+        with self._lock:
+            self._paths.add(path)
+
+    def cleanup(self):
+        """删除登记的文件及yt-dlp的 .part / .ytdl 中间文件"""
+        with self._lock:
+            paths = set(self._paths)
+
+        for path in paths:
+            for candidate in (path, path + '.part', path + '.ytdl'):
+                try:
+                    if os.path.isfile(candidate):
+                        os.remove(candidate)
+                        logger.info(f"已删除取消任务的文件: {candidate}")
+                except OSError as e:
+                    logger.warning(f"删除文件失败 {candidate}: {e}")
+
+
+@contextmanager
+def bind(token: CancelToken):
+    """将当前线程绑定到取消令牌"""
+    _context.token = token
+    try:
+        yield token
+    finally:
+        _context.token = None
+
+
+def current() -> Optional[CancelToken]:
+    """当前线程绑定的取消令牌，未绑定时为None"""
+    return getattr(_context, 'token', None)
+
+
+def check():
+    """检查点：当前子任务已取消时抛出 JobCancelled"""
+    token = current()
+    if token is not None and token.cancelled:
+        raise JobCancelled()
+
+
+def track(path: Optional[str]):
+    """登记当前子任务产生的文件，未绑定令牌时忽略"""
+    token = current()
+    if token is not None and path:
+        token.track(path)
+
+
+def run_process(cmd: List[str], terminate_timeout: float = 5) -> subprocess.CompletedProcess:
+    """
+    在当前线程中执行子进程并捕获输出，与 subprocess.run(capture_output=True, text=True) 行为一致
+
+    等待期间定期检查当前子任务的取消令牌，取消时先 terminate()，terminate_timeout 秒内未退出再 kill()，
+    然后抛出 JobCancelled，子进程占用的CPU立即释放。
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        while True:
+            try:
+                # 超时后重新调用 communicate 不会丢失已读取的输出
+                stdout, stderr = process.communicate(timeout=PROCESS_POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                token = current()
+                if token is not None and token.cancelled:
+                    process.terminate()
+                    try:
+                        process.wait(timeout=terminate_timeout)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    raise JobCancelled()
+    except BaseException:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
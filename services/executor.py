@@ -0,0 +1,121 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, List, Optional
+
+from config import Config
+from . import cancellation
+from .scheduler import PriorityScheduler, PRIORITY_DOWNLOAD
+
+_executor: Optional[PriorityScheduler] = None
+_executor_lock = threading.Lock()
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+_worker_state = threading.local()
+
+# 等待进程池结果时检查取消状态的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.5
+
+
+def _mark_worker_thread():
+    """标记当前线程为共享线程池的工作线程"""
+    _worker_state.is_worker = True
+
+
+def in_worker_thread() -> bool:
+    """当前线程是否属于共享线程池"""
+    return getattr(_worker_state, 'is_worker', False)
+
+
+def get_executor() -> PriorityScheduler:
+    """
+    获取共享的I/O优先级线程池
+
+    通用线程数由 Config.MAX_CONCURRENT_DOWNLOADS 决定，另有 Config.RESERVED_LIGHT_WORKERS
+    个线程只处理元数据探测
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = PriorityScheduler(
+                    workers=max(1, Config.MAX_CONCURRENT_DOWNLOADS),
+                    reserved_workers=Config.RESERVED_LIGHT_WORKERS,
+                    aging_seconds=Config.PRIORITY_AGING_SECONDS,
+                    initializer=_mark_worker_thread
+                )
+    return _executor
+
+
+def map_ordered(func: Callable, items: Iterable, on_error: Callable,
+                priority: int = PRIORITY_DOWNLOAD) -> List:
+    """
+    并发处理批量任务，按输入顺序返回结果
+
+    Args:
+        func: 处理单个元素的函数
+        items: 待处理的元素
+        on_error: 单个元素失败时调用 on_error(item, exception) 生成错误结果，
+                  保证一个元素的异常不影响其他元素
+        priority: 调度优先级，见 services.scheduler
+
+    Returns:
+        list: 与输入顺序一致的结果列表
+    """
+    items = list(items)
+
+    def run(item):
+        try:
+            return func(item)
+        except Exception as e:
+            return on_error(item, e)
+
+    # 已在共享线程池中时直接串行执行，避免占满线程池后互相等待造成死锁
+    if in_worker_thread() or len(items) <= 1:
+        return [run(item) for item in items]
+
+    futures = [get_executor().submit(run, item, priority=priority) for item in items]
+    return [future.result() for future in futures]
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取CPU密集型任务专用的进程池，大小由 Config.CPU_WORKERS 决定（默认等于CPU核数）"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # 使用spawn启动子进程，避免在多线程的Flask进程中fork
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=max(1, Config.CPU_WORKERS),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _process_pool
+
+
+def run_cpu(func: Callable, *args, **kwargs):
+    """
+    在进程池中执行在Python中完成的CPU密集型任务（视频解码、JPEG编码）并等待结果
+
+    调用线程只阻塞等待，不再与网络I/O线程争抢GIL。func必须是模块顶层函数。
+    等待期间当前子任务被取消时放弃结果并抛出 JobCancelled，线程立即释放。取消只停止等待：
+    尚未开始的任务会被撤销，已在子进程中运行的任务会继续执行到结束（强行终止会破坏整个进程池），
+    此后写出的文件不在取消清理范围内，由存储管理器按目录配额回收。
+    本身就是外部程序的处理（如ffmpeg转码）不经过进程池，用 cancellation.run_process 启动，取消时可立即终止。
+    """
+    global _process_pool
+    try:
+        future = get_process_pool().submit(func, *args, **kwargs)
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except FutureTimeout:
+                token = cancellation.current()
+                if token is not None and token.cancelled:
+                    future.cancel()
+                    raise cancellation.JobCancelled()
+    except BrokenProcessPool:
+        # 子进程异常退出后进程池不可再用，重置后由下一次调用重新创建
+        with _process_pool_lock:
+            _process_pool = None
+        raise Exception('媒体处理进程异常退出')
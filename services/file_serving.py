@@ -0,0 +1,78 @@
+import os
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from flask import current_app, request
+from loguru import logger
+from werkzeug.utils import send_file
+
+SERVE_BACKENDS = ('direct', 'x-sendfile', 'x-accel-redirect')
+
+
+class FileServer:
+    """
+    按配置选择文件发送方式
+
+    - direct: 由WSGI服务器发送文件。gunicorn 等提供 wsgi.file_wrapper 的服务器用 sendfile(2)
+      在内核中完成复制；Range请求和开发服务器仍经Python逐块转发。
+    - x-sendfile: 只返回 X-Sendfile 头，由 Apache(mod_xsendfile) / lighttpd 读取文件。
+    - x-accel-redirect: 只返回 X-Accel-Redirect 头，由nginx从 internal location 发送，
+      Range和条件请求由nginx处理。locations 把本地目录映射到location前缀，不在映射内的文件退回 direct。
+
+    交给代理发送时，Python只生成响应头，大文件传输不再占用worker线程。
+    """
+
+    def __init__(self, backend: str = 'direct', locations: Optional[Dict[str, str]] = None):
+        if backend not in SERVE_BACKENDS:
+            raise ValueError(f'不支持的文件发送方式: {backend}')
+        self.backend = backend
+        # 长目录优先匹配
+        self.locations = sorted(
+            ((os.path.realpath(directory), prefix.rstrip('/')) for directory, prefix in (locations or {}).items()),
+            key=lambda item: -len(item[0])
+        )
+
+    def send(self, path: str, download_name: Optional[str] = None, mimetype: Optional[str] = None,
+             as_attachment: bool = True, etag=True):
+        """
+        发送文件，支持Range和 If-None-Match / If-Range 条件请求
+
+        Args:
+            path: 文件路径，相对路径相对于应用根目录
+            etag: 强ETag字符串，True 时按修改时间和大小生成
+        """
+        path = os.path.join(current_app.root_path, path)
+        kwargs = {
+            'environ': request.environ,
+            'mimetype': mimetype,
+            'as_attachment': as_attachment,
+            'download_name': download_name,
+            'etag': etag,
+            'response_class': current_app.response_class,
+        }
+
+        if self.backend == 'x-accel-redirect':
+            uri = self.accel_uri(path)
+            if uri is not None:
+                # 只生成响应头，条件请求和Range交给nginx
+                response = send_file(path, use_x_sendfile=True, conditional=False, **kwargs)
+                del response.headers['X-Sendfile']
+                response.headers['X-Accel-Redirect'] = uri
+                return response
+            logger.debug(f"文件不在 X-Accel-Redirect 映射目录中，直接发送: {path}")
+
+        response = send_file(path, use_x_sendfile=self.backend == 'x-sendfile', conditional=True, **kwargs)
+        if self.backend != 'x-sendfile':
+            # 完整响应也声明支持分段请求，客户端中断后可以续传
+            response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    def accel_uri(self, path: str) -> Optional[str]:
+        """本地文件对应的nginx internal location地址，不在映射目录中时返回None"""
+        real_path = os.path.realpath(path)
+        for directory, prefix in self.locations:
+            if real_path.startswith(directory + os.sep):
+                relative = os.path.relpath(real_path, directory).replace(os.sep, '/')
+                return quote(f"{prefix}/{relative}", safe='/')
+        return None
+
@@ -0,0 +1,85 @@
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+
+class PooledSession(requests.Session):
+    """
+    按主机划分连接池的 requests.Session
+
+    pool_sizes 以域名后缀为键（如 "kuaishou.com" 同时匹配 v.kuaishou.com 和 www.kuaishou.com），
+    "default" 为其他主机的连接池大小。连接保持长连接并在各服务、各线程之间复用，
+    未指定超时的请求使用默认超时。
+    """
+
+    def __init__(self, pool_sizes: Dict[str, int], timeout=None):
+        super().__init__()
+        self.timeout = timeout
+        default_size = pool_sizes.get('default', 10)
+        self._default_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=default_size)
+        self.mount('http://', self._default_adapter)
+        self.mount('https://', self._default_adapter)
+        # 长后缀优先匹配
+        self._host_adapters = [
+            (suffix, HTTPAdapter(pool_connections=4, pool_maxsize=size))
+            for suffix, size in sorted(pool_sizes.items(), key=lambda item: -len(item[0]))
+            if suffix != 'default'
+        ]
+
+    def get_adapter(self, url: str):
+        host = (urlparse(url).hostname or '').lower()
+        for suffix, adapter in self._host_adapters:
+            if host == suffix or host.endswith('.' + suffix):
+                return adapter
+        return super().get_adapter(url)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+class HttpClient:
+    """
+    共享连接池的轻量客户端，保存调用方自己的默认请求头
+
+    各服务持有自己的 HttpClient，底层都使用 get_http_session() 返回的同一个连接池。
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None):
+        self.headers = dict(headers or {})
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> requests.Response:
+        merged = dict(self.headers)
+        if headers:
+            merged.update(headers)
+        return get_http_session().request(method, url, headers=merged, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+
+_session: Optional[PooledSession] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> PooledSession:
+    """获取全局共享的HTTP连接池"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession(Config.HTTP_POOL_SIZES, timeout=Config.HTTP_TIMEOUT)
+    return _session
@@ -0,0 +1,20 @@
+from .scheduler import PRIORITY_BGM, PRIORITY_DOWNLOAD, PRIORITY_THUMBNAIL
+
+
+def register_media_handlers(job_manager, video_downloader, bgm_extractor, thumbnail_extractor):
+    """注册下载、BGM提取、封面提取三类批处理任务，API进程和worker进程共用"""
+    job_manager.register(
+        'download',
+        lambda url, params: video_downloader.download_single(url),
+        PRIORITY_DOWNLOAD
+    )
+    job_manager.register(
+        'bgm',
+        lambda url, params: bgm_extractor.extract_single(url),
+        PRIORITY_BGM
+    )
+    job_manager.register(
+        'thumbnail',
+        lambda url, params: thumbnail_extractor.extract_single(url, params.get('timestamp', 0)),
+        PRIORITY_THUMBNAIL
+    )
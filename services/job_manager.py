@@ -0,0 +1,386 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from . import cancellation, progress
+from .job_queue import LocalJobQueue
+from .job_store import JobStore
+from .scheduler import PRIORITY_DOWNLOAD
+from .storage_manager import get_storage_manager
+
+
+class Job:
+    """批处理任务，每个URL对应一个子项"""
+
+    def __init__(self, job_id: str, kind: str, urls: List[str], params: Optional[Dict] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params or {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.items = [
+            {'url': url, 'status': 'queued', 'result': None}
+            for url in urls
+        ]
+
+    @classmethod
+    def from_record(cls, record: Dict) -> 'Job':
+        """从持久化记录恢复任务"""
+        job = cls(record['job_id'], record['kind'], [], record['params'])
+        job.created_at = record['created_at']
+        job.finished_at = record['finished_at']
+        job.items = record['items']
+        return job
+
+    @property
+    def status(self) -> str:
+        """根据子项状态计算任务状态: queued / running / done / failed / cancelled"""
+        statuses = [item['status'] for item in self.items]
+        if all(s == 'queued' for s in statuses):
+            return 'queued'
+        if any(s in ('queued', 'running') for s in statuses):
+            return 'running'
+        if all(s == 'error' for s in statuses):
+            return 'failed'
+        if 'success' not in statuses:
+            return 'cancelled'
+        return 'done'
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def to_dict(self, include_results: bool = False) -> Dict:
+        """序列化任务状态"""
+        completed = sum(1 for item in self.items if item['status'] in ('success', 'error', 'cancelled'))
+        data = {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': len(self.items),
+            'completed': completed,
+            'succeeded': sum(1 for item in self.items if item['status'] == 'success'),
+            'failed': sum(1 for item in self.items if item['status'] == 'error'),
+            'cancelled': sum(1 for item in self.items if item['status'] == 'cancelled'),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'items': [
+                {'index': i, 'url': item['url'], 'status': item['status']}
+                for i, item in enumerate(self.items)
+            ]
+        }
+        if include_results:
+            data['results'] = [item['result'] for item in self.items]
+        return data
+
+
+class JobManager:
+    """异步任务管理器
+
+    提交后立即返回任务ID，每个URL作为独立的子任务执行，HTTP请求不再需要等待整批处理完成。
+    任务状态和产物写入 JobStore，进程重启后调用 resume() 继续执行未完成的子项，
+    已完成的子项不会重复处理。cancel() 可以取消整个任务或单个URL，正在执行的下载会被中断并删除中间文件。
+
+    子项通过任务队列分发：LocalJobQueue 在本进程线程池中执行；SQLiteJobQueue 由独立的
+    worker 进程认领执行，此时任务状态、进度和取消请求都经由数据库传递。
+    """
+
+    def __init__(self, store: JobStore, queue=None, retention_seconds: int = 3600):
+        self.store = store
+        self.queue = queue or LocalJobQueue()
+        self.retention_seconds = retention_seconds
+        self._broker = progress.get_progress_broker()
+        self._handlers: Dict[str, tuple] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._tokens: Dict[Tuple[str, int], cancellation.CancelToken] = {}
+        self._lock = threading.RLock()
+        if not self.queue.remote:
+            self.queue.bind(self._consume)
+
+    def register(self, kind: str, handler: Callable[[str, Dict], Dict], priority: int = PRIORITY_DOWNLOAD):
+        """注册任务类型，handler(url, params) 处理单个URL并返回结果字典"""
+        self._handlers[kind] = (handler, priority)
+
+    def submit(self, kind: str, urls: List[str], params: Optional[Dict] = None) -> Job:
+        """提交批处理任务"""
+        if kind not in self._handlers:
+            raise ValueError(f'未知的任务类型: {kind}')
+        self._prune_expired()
+
+        job = Job(uuid.uuid4().hex, kind, urls, params)
+        self.store.create_job(job.job_id, kind, job.params, urls, job.created_at)
+        if not self.queue.remote:
+            with self._lock:
+                self._jobs[job.job_id] = job
+
+        self._enqueue(job, range(len(urls)))
+        logger.info(f"任务已提交: {job.job_id} ({kind}, {len(urls)} 个URL)")
+        return job
+
+    def resume(self) -> int:
+        """恢复上次进程退出时未完成的任务，返回恢复的任务数"""
+        if self.queue.remote:
+            # 共享队列本身是持久化的，worker 重启后会继续认领
+            return 0
+
+        resumed = 0
+        for record in self.store.unfinished_jobs():
+            if record['kind'] not in self._handlers:
+                logger.warning(f"跳过未知类型的任务: {record['job_id']} ({record['kind']})")
+                continue
+
+            job = Job.from_record(record)
+            pending = [i for i, item in enumerate(job.items) if item['status'] in ('queued', 'running')]
+            # 中断时正在执行的子项重新排队，yt-dlp 会从已有的 .part 文件继续下载
+            for index in pending:
+                job.items[index]['status'] = 'queued'
+            with self._lock:
+                self._jobs[job.job_id] = job
+
+            self._enqueue(job, pending)
+            resumed += 1
+            logger.info(f"已恢复任务: {job.job_id} ({len(pending)}/{len(job.items)} 个URL待处理)")
+        return resumed
+
+    def cancel(self, job_id: str, index: Optional[int] = None) -> Optional[Job]:
+        """
+        取消任务中尚未完成的子项，index为None时取消整个任务
+
+        排队中的子项直接标记为 cancelled，不再占用工作线程；执行中的子项
+        在下一次进度回调或检查点中止，正在运行的ffmpeg子进程被立即终止，
+        正在等待的媒体处理进程结果被放弃（见 executor.run_cpu）。
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+
+        with self._lock:
+            indexes = range(len(job.items)) if index is None else [index]
+            for i in indexes:
+                status = job.items[i]['status']
+                if status not in ('queued', 'running'):
+                    continue
+                if self.queue.remote:
+                    # 尚未被认领的子项直接出队，已认领的由worker在下次检查时取消
+                    if status == 'queued' and self.queue.discard(job_id, i):
+                        self._finish_item(job, i, 'cancelled', self._cancelled_result(job.items[i]['url']))
+                    else:
+                        self.queue.request_cancel(job_id, i)
+                    continue
+
+                self.cancel_local(job_id, i)
+                if status == 'queued':
+                    self._finish_item(job, i, 'cancelled', self._cancelled_result(job.items[i]['url']))
+        logger.info(f"任务已取消: {job_id}" + ('' if index is None else f" (子项 {index})"))
+        return self.get_job(job_id)
+
+    def cancel_local(self, job_id: str, index: int):
+        """取消本进程中执行的子项"""
+        with self._lock:
+            token = self._tokens.get((job_id, index))
+        if token is not None:
+            token.cancel()
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """获取任务，内存中不存在时从持久化存储读取"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            record = self.store.get_job(job_id)
+            if record is not None:
+                job = Job.from_record(record)
+        return job
+
+    def watch(self, job_id: str, keepalive: float = 15.0, poll_interval: float = 1.0) -> Iterator[Optional[Dict]]:
+        """
+        订阅任务事件，任务结束后生成器退出，长时间没有事件时产出None
+
+        本地队列直接订阅进度广播；共享队列下子项在worker进程中执行，改为轮询数据库。
+        """
+        if not self.queue.remote:
+            job = self.get_job(job_id)
+            if job is None:
+                return
+            # 订阅前已结束（包括重启后从存储读取）的任务不会再有广播，直接返回最终状态
+            if job.is_finished:
+                yield from self._broker.snapshot(job_id)
+                yield {'type': 'done', 'job': job.to_dict()}
+                return
+            yield from self._broker.subscribe(job_id, keepalive, lambda: self._final_event(job_id))
+            return
+
+        statuses = {}
+        progress_seen = {}
+        idle = 0.0
+        while True:
+            job = self.get_job(job_id)
+            if job is None:
+                return
+
+            events = []
+            for index, item in enumerate(job.items):
+                if statuses.get(index, 'queued') != item['status']:
+                    statuses[index] = item['status']
+                    events.append({
+                        'type': 'item',
+                        'index': index,
+                        'item_status': item['status'],
+                        'updated_at': time.time()
+                    })
+            for event in self.queue.progress(job_id):
+                if progress_seen.get(event['index']) != event['updated_at']:
+                    progress_seen[event['index']] = event['updated_at']
+                    events.append(event)
+
+            for event in events:
+                yield event
+            if job.is_finished:
+                yield {'type': 'done', 'job': job.to_dict()}
+                return
+
+            idle = 0.0 if events else idle + poll_interval
+            if idle >= keepalive:
+                idle = 0.0
+                yield None
+            time.sleep(poll_interval)
+
+    def _final_event(self, job_id: str) -> Optional[Dict]:
+        """任务已结束时返回 done 事件，否则返回None"""
+        job = self.get_job(job_id)
+        if job is not None and job.is_finished:
+            return {'type': 'done', 'job': job.to_dict()}
+        return None
+
+    def run_claimed(self, job_id: str, index: int, cancel_requested: bool = False):
+        """在worker进程中执行从共享队列认领的子项"""
+        job = self.get_job(job_id)
+        if job is None or job.items[index]['status'] not in ('queued', 'running'):
+            return
+
+        token = cancellation.CancelToken()
+        if cancel_requested:
+            token.cancel()
+        with self._lock:
+            self._tokens[(job_id, index)] = token
+        self._run_item(job, index)
+
+    def _enqueue(self, job: Job, indexes):
+        _, priority = self._handlers[job.kind]
+        for index in indexes:
+            if not self.queue.remote:
+                with self._lock:
+                    self._tokens[(job.job_id, index)] = cancellation.CancelToken()
+            self.queue.put(job.job_id, index, priority)
+
+    def _consume(self, job_id: str, index: int):
+        """本地队列的消费函数"""
+        job = self.get_job(job_id)
+        if job is not None:
+            self._run_item(job, index)
+
+    def _run_item(self, job: Job, index: int):
+        """在后台线程中处理单个URL"""
+        item = job.items[index]
+        handler, _ = self._handlers[job.kind]
+        with self._lock:
+            token = self._tokens.get((job.job_id, index))
+            # 排队期间已被取消并结束的子项直接跳过，立即归还工作线程
+            if token is None:
+                return
+            if token.cancelled:
+                self._finish_item(job, index, 'cancelled', self._cancelled_result(item['url']))
+                return
+            self._set_item_status(job, index, 'running')
+
+        try:
+            with progress.bind(job.job_id, index), cancellation.bind(token):
+                result = handler(item['url'], job.params)
+        except Exception as e:
+            result = {
+                'url': item['url'],
+                'status': 'error',
+                'error': str(e),
+                'filepath': None
+            }
+
+        if token.cancelled:
+            # 处理函数可能把 JobCancelled 包装成普通错误，这里以令牌状态为准；
+            # 只删除本子项自己登记的文件，结果中的文件可能来自合并的请求，仍被其他任务使用
+            token.cleanup()
+            result = self._cancelled_result(item['url'])
+            status = 'cancelled'
+        else:
+            status = 'success' if result.get('status') == 'success' else 'error'
+            if status == 'success':
+                self._record_artifact(job, index, result)
+
+        with self._lock:
+            self._finish_item(job, index, status, result)
+
+    @staticmethod
+    def _cancelled_result(url: str) -> Dict:
+        return {
+            'url': url,
+            'status': 'cancelled',
+            'error': cancellation.JobCancelled.msg,
+            'filepath': None
+        }
+
+    def _finish_item(self, job: Job, index: int, status: str, result: Optional[Dict] = None):
+        """记录子项的最终状态，全部子项结束时完成任务，调用方需持有锁"""
+        job.items[index]['result'] = result
+        self._set_item_status(job, index, status, result)
+        self._tokens.pop((job.job_id, index), None)
+
+        if self.queue.remote:
+            # 其他子项可能由别的worker执行，以数据库中的状态为准
+            self._broker.discard(job.job_id)
+            job = self.get_job(job.job_id)
+        if not job.is_finished or job.finished_at is not None:
+            return
+        job.finished_at = time.time()
+        self.store.update_job(job.job_id, job.status, job.finished_at)
+        logger.info(f"任务已完成: {job.job_id} ({job.status})")
+        if not self.queue.remote:
+            self._broker.close(job.job_id, {'type': 'done', 'job': job.to_dict()})
+
+    def _record_artifact(self, job: Job, index: int, result: Dict):
+        """登记产物文件的大小和哈希"""
+        path = result.get('temp_filepath') or result.get('filepath')
+        if not path:
+            return
+        try:
+            artifact = self.store.record_artifact(job.job_id, index, path, result.get('sha256'))
+            result['sha256'] = artifact['sha256']
+            get_storage_manager().register(path)
+        except OSError as e:
+            logger.warning(f"产物登记失败 {path}: {e}")
+
+    def _set_item_status(self, job: Job, index: int, status: str, result: Optional[Dict] = None):
+        """更新子项状态，写入存储并推送给订阅者"""
+        job.items[index]['status'] = status
+        self.store.update_item(job.job_id, index, status, result)
+        if status == 'running':
+            self.store.update_job(job.job_id, 'running')
+        self._broker.publish(job.job_id, {
+            'type': 'item',
+            'index': index,
+            'item_status': status,
+            'updated_at': time.time()
+        })
+
+    def _prune_expired(self):
+        """移除已完成且超过保留时间的任务"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at and now - job.finished_at > self.retention_seconds
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in set(expired) | set(self.store.delete_finished_before(now - self.retention_seconds)):
+            self._broker.discard(job_id)
@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .executor import get_executor
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    worker_id TEXT,
+    claim_id TEXT,
+    heartbeat_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_queue_worker ON job_queue (worker_id);
+"""
+
+
+class LocalJobQueue:
+    """
+    进程内任务队列（默认）
+
+    子项直接提交到本进程的共享线程池执行，API进程同时承担下载工作。
+    """
+
+    remote = False
+
+    def __init__(self, executor=None):
+        self._executor = executor or get_executor()
+        self._consumer: Optional[Callable[[str, int], None]] = None
+
+    def bind(self, consumer: Callable[[str, int], None]):
+        """设置消费函数 consumer(job_id, index)"""
+        self._consumer = consumer
+
+    def put(self, job_id: str, index: int, priority: int):
+        self._executor.submit(self._consumer, job_id, index, priority=priority)
+
+
+class SQLiteJobQueue:
+    """
+    基于SQLite的共享任务队列
+
+    API进程只负责入队，由一个或多个 worker.py 进程认领执行。worker 定期续约，
+    超过 lease_seconds 未续约的认领视为worker已退出，子项会被其他worker重新认领。
+    取消请求和下载进度也经由队列表在进程之间传递。
+    """
+
+    remote = True
+
+    def __init__(self, db_path: str, lease_seconds: float = 60, aging_seconds: float = 30):
+        self.lease_seconds = lease_seconds
+        self.aging_seconds = aging_seconds
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(QUEUE_SCHEMA)
+            self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple = ()) -> Tuple[List[sqlite3.Row], int]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            rows = cursor.fetchall()
+            self._conn.commit()
+            return rows, cursor.rowcount
+
+    def put(self, job_id: str, index: int, priority: int):
+        self._execute(
+            'INSERT OR REPLACE INTO job_queue (job_id, idx, priority, enqueued_at) VALUES (?, ?, ?, ?)',
+            (job_id, index, priority, time.time())
+        )
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        认领一个子项，返回 {'job_id', 'idx', 'cancel_requested'}，没有可执行的子项时返回None
+
+        排序规则与 PriorityScheduler 相同：每等待 aging_seconds 秒有效优先级提升一级。
+        """
+        now = time.time()
+        claim_id = uuid.uuid4().hex
+        _, claimed = self._execute(
+            """
+            UPDATE job_queue SET worker_id = ?, claim_id = ?, heartbeat_at = ?
+            WHERE rowid = (
+                SELECT rowid FROM job_queue
+                WHERE worker_id IS NULL OR heartbeat_at < ?
+                ORDER BY priority - (? - enqueued_at) / ?, enqueued_at
+                LIMIT 1
+            )
+            """,
+            (worker_id, claim_id, now, now - self.lease_seconds, now, self.aging_seconds)
+        )
+        if not claimed:
+            return None
+        rows, _ = self._execute(
+            'SELECT job_id, idx, cancel_requested FROM job_queue WHERE claim_id = ?',
+            (claim_id,)
+        )
+        return dict(rows[0]) if rows else None
+
+    def heartbeat(self, worker_id: str):
+        """为该worker认领的全部子项续约"""
+        self._execute('UPDATE job_queue SET heartbeat_at = ? WHERE worker_id = ?', (time.time(), worker_id))
+
+    def release(self, worker_id: str):
+        """worker正常退出时归还未完成的认领"""
+        self._execute(
+            'UPDATE job_queue SET worker_id = NULL, claim_id = NULL, heartbeat_at = NULL, progress = NULL '
+            'WHERE worker_id = ?',
+            (worker_id,)
+        )
+
+    def done(self, job_id: str, index: int):
+        self._execute('DELETE FROM job_queue WHERE job_id = ? AND idx = ?', (job_id, index))
+
+    def discard(self, job_id: str, index: int) -> bool:
+        """移除尚未被认领的子项，成功返回True"""
+        _, removed = self._execute(
+            'DELETE FROM job_queue WHERE job_id = ? AND idx = ? AND worker_id IS NULL',
+            (job_id, index)
+        )
+        return removed > 0
+
+    def request_cancel(self, job_id: str, index: int):
+        """请求认领该子项的worker取消执行"""
+        self._execute(
+            'UPDATE job_queue SET cancel_requested = 1 WHERE job_id = ? AND idx = ?',
+            (job_id, index)
+        )
+
+    def cancel_requests(self, worker_id: str) -> List[Tuple[str, int]]:
+        """该worker正在执行且已被请求取消的子项"""
+        rows, _ = self._execute(
+            'SELECT job_id, idx FROM job_queue WHERE worker_id = ? AND cancel_requested = 1',
+            (worker_id,)
+        )
+        return [(row['job_id'], row['idx']) for row in rows]
+
+    def update_progress(self, job_id: str, index: int, event: Dict):
+        """记录子项的最新进度，供API进程推送"""
+        self._execute(
+            'UPDATE job_queue SET progress = ? WHERE job_id = ? AND idx = ?',
+            (json.dumps(event, ensure_ascii=False), job_id, index)
+        )
+
+    def progress(self, job_id: str) -> List[Dict]:
+        """任务中各执行中子项的最新进度"""
+        rows, _ = self._execute(
+            'SELECT progress FROM job_queue WHERE job_id = ? AND progress IS NOT NULL ORDER BY idx',
+            (job_id,)
+        )
+        return [json.loads(row['progress']) for row in rows]
+
+
+def create_job_queue(backend: str, db_path: str, lease_seconds: float = 60, aging_seconds: float = 30):
+    """根据配置创建任务队列: local / sqlite"""
+    if backend == 'local':
+        return LocalJobQueue()
+    if backend == 'sqlite':
+        return SQLiteJobQueue(db_path, lease_seconds=lease_seconds, aging_seconds=aging_seconds)
+    raise ValueError(f'不支持的任务队列后端: {backend}')
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_artifacts_job ON artifacts (job_id);
+"""
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobStore:
+    """
+    基于SQLite的任务与产物持久化存储
+
+    记录任务(queued / running / done / failed)、每个URL的状态和结果，
+    以及产物文件的路径、大小和哈希，进程重启后可以据此恢复未完成的任务。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            # 旧版本创建的产物表没有 mtime 列
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(artifacts)')}
+            if 'mtime' not in columns:
+                self._conn.execute('ALTER TABLE artifacts ADD COLUMN mtime REAL')
+            self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            rows = cursor.fetchall()
+            self._conn.commit()
+            return rows
+
+    def create_job(self, job_id: str, kind: str, params: Dict, urls: List[str], created_at: float):
+        """写入新任务及其全部子项"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (job_id, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(params, ensure_ascii=False), 'queued', created_at, created_at)
+            )
+            self._conn.executemany(
+                'INSERT INTO job_items (job_id, idx, url, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [(job_id, idx, url, 'queued', created_at) for idx, url in enumerate(urls)]
+            )
+            self._conn.commit()
+
+    def update_item(self, job_id: str, idx: int, status: str, result: Optional[Dict] = None):
+        """更新子项状态和结果"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'UPDATE job_items SET status = ?, result = ?, updated_at = ? WHERE job_id = ? AND idx = ?',
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, now, job_id, idx)
+            )
+            self._conn.execute('UPDATE jobs SET updated_at = ? WHERE job_id = ?', (now, job_id))
+            self._conn.commit()
+
+    def update_job(self, job_id: str, status: str, finished_at: Optional[float] = None):
+        """更新任务状态"""
+        self._execute(
+            'UPDATE jobs SET status = ?, finished_at = ?, updated_at = ? WHERE job_id = ?',
+            (status, finished_at, time.time(), job_id)
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """读取任务及其子项"""
+        rows = self._execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
+        if not rows:
+            return None
+        return self._load(rows[0])
+
+    def unfinished_jobs(self) -> List[Dict]:
+        """所有未完成（queued / running）的任务"""
+        rows = self._execute("SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at")
+        return [self._load(row) for row in rows]
+
+    def _load(self, row: sqlite3.Row) -> Dict:
+        items = self._execute('SELECT * FROM job_items WHERE job_id = ? ORDER BY idx', (row['job_id'],))
+        return {
+            'job_id': row['job_id'],
+            'kind': row['kind'],
+            'params': json.loads(row['params']),
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'finished_at': row['finished_at'],
+            'items': [
+                {
+                    'url': item['url'],
+                    'status': item['status'],
+                    'result': json.loads(item['result']) if item['result'] else None
+                }
+                for item in items
+            ]
+        }
+
+    def record_artifact(self, job_id: str, idx: int, path: str, sha256: Optional[str] = None) -> Dict:
+        """登记产物文件，记录大小、修改时间和SHA-256（已知哈希时不再重新计算）"""
+        stat = os.stat(path)
+        artifact = {
+            'path': path,
+            'job_id': job_id,
+            'idx': idx,
+            'size': stat.st_size,
+            'sha256': sha256 or file_sha256(path),
+            'created_at': time.time(),
+            'mtime': stat.st_mtime
+        }
+        self._execute(
+            'INSERT OR REPLACE INTO artifacts (path, job_id, idx, size, sha256, created_at, mtime) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (artifact['path'], job_id, idx, artifact['size'], artifact['sha256'], artifact['created_at'],
+             artifact['mtime'])
+        )
+        return artifact
+
+    def get_artifact(self, path: str) -> Optional[Dict]:
+        """按路径查询产物"""
+        rows = self._execute('SELECT * FROM artifacts WHERE path = ?', (path,))
+        return dict(rows[0]) if rows else None
+
+    def delete_finished_before(self, timestamp: float) -> List[str]:
+        """删除在指定时间之前完成的任务，返回被删除的任务ID"""
+        rows = self._execute('SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (timestamp,))
+        job_ids = [row['job_id'] for row in rows]
+        with self._lock:
+            for job_id in job_ids:
+                self._conn.execute('DELETE FROM job_items WHERE job_id = ?', (job_id,))
+                self._conn.execute('DELETE FROM artifacts WHERE job_id = ?', (job_id,))
+                self._conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+            self._conn.commit()
+        return job_ids
@@ -1,13 +1,17 @@
 import os
 import re
-import requests
 from typing import Dict, List
 from urllib.parse import urlparse, parse_qs
 import json
-import time
 from loguru import logger
 import subprocess
 import tempfile
+from . import cancellation
+from .http_client import HttpClient
+from .segmented_download import create_segmented_downloader
+from .rate_limiter import get_rate_limiter, is_throttle_status
+from .url_resolver import get_url_resolve_cache
+from .ytdlp_pool import get_ytdlp_pool
 
 class KuaishouDownloader:
     """快手视频下载器"""
@@ -26,8 +30,8 @@ class KuaishouDownloader:
             'Upgrade-Insecure-Requests': '1',
         }
         
-        self.session = requests.Session()
-        self.session.headers.update({
+        # 使用共享的HTTP连接池，各快手下载器实例之间复用连接
+        self.session = HttpClient({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
@@ -40,6 +44,7 @@ class KuaishouDownloader:
             'Sec-Fetch-User': '?1',
             'Cache-Control': 'max-age=0'
         })
+        self.downloader = create_segmented_downloader(self.session)
     
     def extract_share_url(self, text: str) -> str:
         """从分享文本中提取快手链接"""
@@ -58,9 +63,12 @@ class KuaishouDownloader:
         return text.strip()
     
     def get_real_url(self, share_url: str) -> str:
-        """获取快手视频的真实链接"""
+        """获取快手视频的真实链接，解析结果有缓存"""
+        return get_url_resolve_cache().resolve(share_url, self._fetch_redirect) or share_url
+
+    def _fetch_redirect(self, share_url: str):
+        """访问分享链接获取重定向地址，没有重定向时返回原链接，请求失败返回None"""
         try:
-            # 第一步：访问分享链接获取重定向
             response = self.session.get(share_url, allow_redirects=False, verify=False)
             
             if response.status_code == 302:
@@ -74,7 +82,7 @@ class KuaishouDownloader:
             
         except Exception as e:
             logger.error(f"获取真实链接失败: {e}")
-            return share_url
+            return None
     
     def parse_video_info(self, url: str) -> Dict:
         """解析视频信息"""
@@ -139,8 +147,8 @@ class KuaishouDownloader:
     def _parse_mobile_share_url(self, url: str) -> Dict:
         """解析移动端分享链接"""
         try:
-            # 先获取真实URL
-            real_url = self.get_real_url(url)
+            # parse_video_info 传入的已是解析后的链接，不再重复请求
+            real_url = url if 'photoId=' in url else self.get_real_url(url)
             if not real_url:
                 logger.error("无法获取真实URL")
                 return {'error': '无法获取真实URL'}
@@ -158,8 +166,6 @@ class KuaishouDownloader:
             
             # 尝试使用yt-dlp处理快手链接
             try:
-                import yt_dlp
-                
                 ydl_opts = {
                     'quiet': True,
                     'no_warnings': True,
@@ -182,7 +188,7 @@ class KuaishouDownloader:
                 for test_url in urls_to_try:
                     try:
                         logger.info(f"尝试使用yt-dlp解析: {test_url}")
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                        with get_ytdlp_pool().checkout(ydl_opts) as ydl:
                             # 尝试提取视频信息
                             info = ydl.extract_info(test_url, download=False)
                             
@@ -694,6 +700,8 @@ query visionShortVideoReco($semKeyword: String, $semCrowd: String, $utmSource: S
             response = self.session.post(graphql_url, json=payload, headers=headers, params=params, timeout=10)
             logger.info(f"GraphQL响应状态码: {response.status_code}")
             logger.info(f"GraphQL响应长度: {len(response.text)}")
+            if is_throttle_status(response.status_code):
+                get_rate_limiter().report_throttled('kuaishou')
             
             if response.status_code == 200:
                 # 检查响应内容
@@ -901,9 +909,14 @@ query visionShortVideoReco($semKeyword: String, $semCrowd: String, $utmSource: S
     
     def download_video(self, url: str, custom_filename: str = None) -> Dict:
         """下载单个视频"""
+        rate_limiter = get_rate_limiter()
         try:
+            # 按平台限流，令牌不足时等待
+            rate_limiter.acquire('kuaishou')
+
             # 解析视频信息
             video_info = self.parse_video_info(url)
+            cancellation.check()
             
             if not video_info or not video_info.get('play_url'):
                 raise Exception("无法获取视频播放链接")
@@ -918,16 +931,18 @@ query visionShortVideoReco($semKeyword: String, $semCrowd: String, $utmSource: S
             
             # 下载视频
             logger.info(f"开始下载视频: {title}")
-            response = self.session.get(play_url, stream=True, verify=False)
-            response.raise_for_status()
-            
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            cancellation.track(filepath)
+
+            def check_throttle(response):
+                if is_throttle_status(response.status_code):
+                    rate_limiter.report_throttled('kuaishou')
+
+            # 多连接分段下载，服务器不支持Range时退回单连接
+            self.downloader.download(play_url, filepath, on_response=check_throttle, verify=False)
             
             file_size = os.path.getsize(filepath)
             logger.info(f"视频下载完成: {filepath} ({file_size} bytes)")
+            rate_limiter.report_success('kuaishou')
             
             return {
                 'url': url,
@@ -949,20 +964,16 @@ query visionShortVideoReco($semKeyword: String, $semCrowd: String, $utmSource: S
             }
     
     def download_batch(self, urls: List[str]) -> List[Dict]:
-        """批量下载视频"""
+        """批量下载视频，请求频率由共享的平台限流器控制"""
         results = []
         
-        for i, url in enumerate(urls, 1):
-            logger.info(f"正在下载第 {i}/{len(urls)} 个视频")
+        for url in urls:
+            logger.info(f"正在下载视频: {url}")
             
             # 提取分享链接
             clean_url = self.extract_share_url(url)
             result = self.download_video(clean_url)
             results.append(result)
-            
-            # 添加延时避免请求过快
-            if i < len(urls):
-                time.sleep(2)
         
         return results
     
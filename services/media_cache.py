@@ -0,0 +1,183 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from loguru import logger
+
+from config import Config
+from .job_store import file_sha256
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    key TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    ext TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media (sha256);
+CREATE INDEX IF NOT EXISTS idx_media_last_access ON media (last_access);
+"""
+
+
+def link_or_copy(src: str, dst: str):
+    """优先创建硬链接，跨文件系统时退回复制；先写临时名再替换，避免读到不完整的文件"""
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def media_cache_key(platform: str, info: Dict, fmt: Optional[str]) -> Optional[str]:
+    """缓存键：平台:视频ID:格式，视频ID未知时返回None"""
+    video_id = info.get('id')
+    if not video_id:
+        return None
+    return f"{platform}:{video_id}:{fmt or 'default'}"
+
+
+class MediaCache:
+    """
+    按内容寻址的媒体文件缓存
+
+    文件以SHA-256命名保存在 objects 目录下，索引（平台:视频ID:格式 -> 哈希）存于同目录的SQLite，
+    同机的多个worker进程共享。总大小超过 max_bytes 时按最近访问时间淘汰。
+    命中时把缓存文件硬链接到调用方的临时目录，临时文件被清理不影响缓存。
+    同时作为各服务共享的产物登记表：封面和BGM提取可以通过 find_video() 使用已下载的视频。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(INDEX_SCHEMA)
+            self._conn.commit()
+
+    def _object_path(self, sha256: str, ext: Optional[str]) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + (f'.{ext}' if ext else ''))
+
+    def lookup(self, key: Optional[str]) -> Optional[Dict]:
+        """查询缓存，文件缺失或大小不符时视为未命中并移除索引"""
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM media WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+
+            entry = dict(row)
+            entry['path'] = self._object_path(entry['sha256'], entry['ext'])
+            try:
+                intact = os.path.getsize(entry['path']) == entry['size']
+            except OSError:
+                intact = False
+            if not intact:
+                logger.warning(f"媒体缓存文件损坏或缺失，移除: {key}")
+                self._conn.execute('DELETE FROM media WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute('UPDATE media SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        return entry
+
+    def find_video(self, platform: str, video_id: Optional[str]) -> Optional[Dict]:
+        """查找该视频任意格式的本地副本，供封面截帧、音轨提取等派生处理复用"""
+        if not video_id:
+            return None
+        prefix = f"{platform}:{video_id}:"
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key FROM media WHERE substr(key, 1, ?) = ? ORDER BY last_access DESC',
+                (len(prefix), prefix)
+            ).fetchall()
+        for row in rows:
+            entry = self.lookup(row['key'])
+            if entry is not None:
+                return entry
+        return None
+
+    def store(self, key: Optional[str], src_path: str) -> Optional[Dict]:
+        """将下载完成的文件加入缓存（硬链接，不移动原文件）"""
+        if not key or not os.path.isfile(src_path):
+            return None
+
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            return None
+        sha256 = file_sha256(src_path)
+        ext = os.path.splitext(src_path)[1].lstrip('.') or None
+        object_path = self._object_path(sha256, ext)
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if not os.path.exists(object_path):
+            link_or_copy(src_path, object_path)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO media (key, sha256, size, ext, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, sha256, size, ext, now, now)
+            )
+            self._conn.commit()
+            self._evict()
+        logger.info(f"已加入媒体缓存: {key} ({size} bytes)")
+        return {'key': key, 'sha256': sha256, 'size': size, 'ext': ext, 'path': object_path}
+
+    def materialize(self, entry: Dict, dest_path: str):
+        """把缓存文件放到目标路径"""
+        link_or_copy(entry['path'], dest_path)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes()
+
+    def _total_bytes(self) -> int:
+        row = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM media)').fetchone()
+        return row[0]
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限，调用方需持有锁"""
+        total = self._total_bytes()
+        while total > self.max_bytes:
+            row = self._conn.execute('SELECT * FROM media ORDER BY last_access LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._conn.execute('DELETE FROM media WHERE key = ?', (row['key'],))
+            # 同一内容可能被多个键引用，最后一个引用移除时才删除文件
+            if self._conn.execute('SELECT 1 FROM media WHERE sha256 = ?', (row['sha256'],)).fetchone() is None:
+                try:
+                    os.remove(self._object_path(row['sha256'], row['ext']))
+                except OSError:
+                    pass
+                total -= row['size']
+            logger.info(f"媒体缓存淘汰: {row['key']}")
+        self._conn.commit()
+
+
+_cache: Optional[MediaCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """获取全局共享的媒体文件缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MediaCache(Config.MEDIA_CACHE_DIR, Config.MEDIA_CACHE_MAX_BYTES)
+    return _cache
@@ -0,0 +1,86 @@
+"""
+CPU密集型媒体处理函数
+
+extract_frame / build_thumbnail_grid 在Python中解码，运行在独立的进程池中（见 executor.run_cpu），
+必须定义在模块顶层以便序列化，并且只依赖参数本身，不访问任何服务实例状态。
+
+transcode_audio 本身就是启动ffmpeg子进程，直接在调用线程中执行，不经过进程池，
+任务取消时ffmpeg被立即终止。
+"""
+
+import shutil
+
+from . import cancellation
+
+
+def extract_frame(video_path: str, output_path: str, timestamp: float = 0, quality: int = 90) -> float:
+    """从视频中解码指定时间的帧并编码为JPEG，返回实际使用的时间戳"""
+    from moviepy.editor import VideoFileClip
+    from PIL import Image
+
+    video = VideoFileClip(video_path)
+    try:
+        # 确保时间戳在有效范围内
+        if timestamp > video.duration:
+            timestamp = video.duration / 2
+
+        frame = video.get_frame(timestamp)
+        Image.fromarray(frame).save(output_path, 'JPEG', quality=quality)
+        return timestamp
+    finally:
+        video.close()
+
+
+def build_thumbnail_grid(video_path: str, output_path: str, grid_size: tuple = (3, 3),
+                         thumbnail_size: tuple = (160, 90), quality: int = 90) -> int:
+    """均匀抽取多帧并拼接为网格图，返回缩略图数量"""
+    from moviepy.editor import VideoFileClip
+    from PIL import Image
+
+    video = VideoFileClip(video_path)
+    try:
+        rows, cols = grid_size
+        total_thumbnails = rows * cols
+
+        # 计算时间间隔
+        time_interval = video.duration / (total_thumbnails + 1)
+
+        # 创建网格图像
+        grid_image = Image.new('RGB', (cols * thumbnail_size[0], rows * thumbnail_size[1]), 'black')
+
+        for i in range(total_thumbnails):
+            frame = video.get_frame(time_interval * (i + 1))
+            thumbnail = Image.fromarray(frame).resize(thumbnail_size, Image.Resampling.LANCZOS)
+
+            row = i // cols
+            col = i % cols
+            grid_image.paste(thumbnail, (col * thumbnail_size[0], row * thumbnail_size[1]))
+
+        grid_image.save(output_path, 'JPEG', quality=quality)
+        return total_thumbnails
+    finally:
+        video.close()
+
+
+def transcode_audio(source_path: str, output_path: str, bitrate: str = '192') -> str:
+    """将音频（或视频中的音轨）转码为mp3，任务取消时终止ffmpeg并删除输出文件"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        # moviepy依赖的imageio-ffmpeg自带ffmpeg可执行文件
+        try:
+            import imageio_ffmpeg
+            ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+        except Exception:
+            raise Exception('未找到ffmpeg，无法转码音频')
+
+    cancellation.track(output_path)
+    result = cancellation.run_process([
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-i', source_path,
+        '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k',
+        output_path
+    ])
+
+    if result.returncode != 0:
+        raise Exception(f'音频转码失败: {result.stderr.strip()}')
+    return output_path
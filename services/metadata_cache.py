@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from yt_dlp.utils import ReExtractInfo
+
+from config import Config
+from .platforms import canonical_key
+from .rate_limiter import get_rate_limiter
+
+# 缓存的视频信息字段，均与格式选择无关；ext 随 format 不同单独记录
+INFO_FIELDS = (
+    'id', 'title', 'extractor', 'extractor_key', 'duration', 'uploader', 'uploader_id',
+    'description', 'view_count', 'like_count', 'upload_date', 'timestamp', 'thumbnail', 'webpage_url',
+)
+
+
+class MetadataCache:
+    """
+    yt-dlp 视频信息缓存（TTL + LRU）
+
+    以规范标识（如 "bilibili:BV1xx411c7mD"）或 "提取器:视频ID" 为键，只保存精简后的字段，
+    不保存带签名、会过期的格式地址。不同链接形式通过别名指向同一条目。
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str, fmt: str = 'default') -> Optional[Dict]:
+        """按URL查询，未命中、已过期或该格式的扩展名未知时返回None"""
+        with self._lock:
+            key = canonical_key(url) or self._aliases.get(url)
+            entry = self._entries.get(key) if key else None
+            if entry is not None and entry['expires_at'] < time.time():
+                self._evict(key)
+                entry = None
+            if entry is None or fmt not in entry['exts']:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry['info'], ext=entry['exts'][fmt])
+
+    def put(self, url: str, info: Dict, fmt: str = 'default') -> Dict:
+        """写入提取结果，返回精简后的信息"""
+        slim = {field: info.get(field) for field in INFO_FIELDS if info.get(field) is not None}
+        key = canonical_key(url) or f"{info.get('extractor_key')}:{info.get('id')}"
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['expires_at'] < time.time():
+                entry = {'info': slim, 'exts': {}, 'aliases': set(), 'expires_at': time.time() + self.ttl}
+                self._entries[key] = entry
+            entry['exts'][fmt] = info.get('ext')
+            entry['aliases'].add(url)
+            self._aliases[url] = key
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+        return dict(slim, ext=info.get('ext'))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _evict(self, key: str):
+        """移除条目及其别名，调用方需持有锁"""
+        entry = self._entries.pop(key)
+        for alias in entry['aliases']:
+            if self._aliases.get(alias) == key:
+                del self._aliases[alias]
+
+
+_cache: Optional[MetadataCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache() -> MetadataCache:
+    """获取全局共享的视频信息缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MetadataCache(Config.METADATA_CACHE_TTL, Config.METADATA_CACHE_SIZE)
+    return _cache
+
+
+def extract_info(ydl, url: str, platform: Optional[str] = None) -> Optional[Dict]:
+    """
+    带缓存的 ydl.extract_info(url, download=False)
+
+    返回精简后的视频信息，提取失败（返回None）或结果为播放列表时不缓存。
+    提供platform时只在未命中缓存、确实需要请求平台时才获取限流令牌。
+    """
+    cache = get_metadata_cache()
+    fmt = ydl.params.get('format') or 'default'
+    info = cache.get(url, fmt)
+    if info is not None:
+        return info
+
+    if platform:
+        get_rate_limiter().acquire(platform)
+    info = ydl.extract_info(url, download=False)
+    if info is None or info.get('_type', 'video') != 'video':
+        return info
+    return cache.put(url, info, fmt)
+
+
+def extract_and_download(ydl, url: str, platform: Optional[str] = None,
+                         lookup: Optional[Callable[[Dict], Any]] = None) -> Tuple[Optional[Dict], Any]:
+    """
+    一次提取完成信息获取和下载
+
+    先只运行提取器（不做格式选择），lookup(info) 返回本地已有的结果（如媒体缓存条目）时不下载；
+    否则直接用这份信息完成格式选择和下载，不像 extract_info + ydl.download 那样把网页和API请求再执行一遍。
+    缓存中已有视频信息且 lookup 命中时完全不请求平台。
+
+    Returns:
+        (info, local): info 为视频信息，下载的文件路径由 downloaded_filepath(info) 获得；
+                       local 为 lookup 的返回值，进行了下载时为None
+    """
+    cache = get_metadata_cache()
+    fmt = ydl.params.get('format') or 'default'
+    if lookup is not None:
+        info = cache.get(url, fmt)
+        local = lookup(info) if info is not None else None
+        if local:
+            return info, local
+
+    if platform:
+        get_rate_limiter().acquire(platform)
+    info = ydl.extract_info(url, download=False, process=False)
+    if info is None:
+        return None, None
+
+    local = None
+    if lookup is not None and info.get('_type', 'video') == 'video':
+        local = lookup(info)
+    try:
+        info = ydl.process_ie_result(info, download=not local)
+    except ReExtractInfo:
+        # 格式地址已失效等情况需要重新提取，交给yt-dlp完整处理
+        info = ydl.extract_info(url, download=not local)
+
+    if info is not None and info.get('_type', 'video') == 'video':
+        cache.put(url, info, fmt)
+    return info, local
+
+
+def downloaded_filepath(info: Optional[Dict]) -> Optional[str]:
+    """yt-dlp 下载（含合并、后处理）完成后的最终文件路径，取自 requested_downloads"""
+    if not info:
+        return None
+    # 播放列表取第一个下载成功的条目
+    for entry in [info] + list(info.get('entries') or []):
+        for download in (entry or {}).get('requested_downloads') or []:
+            path = download.get('filepath')
+            if path and os.path.exists(path):
+                return path
+    return None
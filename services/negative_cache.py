@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+from config import Config
+from .cancellation import JobCancelled
+from .rate_limiter import is_throttle_error
+
+# 重试可能成功的错误，优先于下面的分类判断；需要登录取决于当时的cookie和风控状态，不代表视频本身不可用。
+# YouTube 限流时返回 "Video unavailable. This content isn't available, try again later"
+TRANSIENT_MARKERS = ('timeout', 'timed out', '超时', 'temporarily', 'service unavailable', 'http error 5', '网络',
+                     'login required', 'try again later')
+
+# 失败原因分类，按顺序匹配错误信息（小写）；未匹配的错误视为临时错误，不缓存。
+# 地区限制匹配yt-dlp的原文："...not made this video available in your country"（YouTube）、
+# "This video may be deleted or geo-restricted"（B站）、"...due to geo restriction"（GeoRestrictedError）
+FAILURE_MARKERS = (
+    ('region', ('地区限制', 'geo restrict', 'geo-restrict', 'geoblock', 'available in your country')),
+    ('private', ('私人视频', '需要权限', 'private video', 'this video is private')),
+    ('deleted', ('已被删除', '已删除', '作品不存在', 'video unavailable', 'has been removed',
+                 'does not exist', 'http error 404')),
+    ('unsupported', ('不支持的平台', 'unsupported url')),
+)
+
+
+def classify_failure(error) -> Optional[str]:
+    """
+    判断失败原因: deleted / private / region / unsupported
+
+    网络超时、平台限流、任务取消等重试可能成功的错误返回None。
+    """
+    if isinstance(error, JobCancelled) or is_throttle_error(error):
+        return None
+    message = str(error).lower()
+    if any(marker in message for marker in TRANSIENT_MARKERS):
+        return None
+    for reason, markers in FAILURE_MARKERS:
+        if any(marker in message for marker in markers):
+            return reason
+    return None
+
+
+class NegativeCache:
+    """
+    已知失效链接缓存
+
+    以规范标识（如 "bilibili:BV1xx411c7mD"）为键记录确定性失败（已删除、私密、地区限制等），
+    有效期内的重复请求直接返回上次的错误，不再占用worker执行完整的提取流程。
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int = 5000):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """返回 {'reason', 'error', 'expires_at'}，未记录或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] < time.time():
+                del self._entries[key]
+                return None
+            self.hits += 1
+            return dict(entry)
+
+    def record(self, key: str, error) -> Optional[str]:
+        """按失败原因记录错误，返回失败原因，临时错误不记录并返回None"""
+        reason = classify_failure(error)
+        ttl = self.ttls.get(reason) if reason else None
+        if not ttl:
+            return None
+        with self._lock:
+            self._entries[key] = {'reason': reason, 'error': str(error), 'expires_at': time.time() + ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"记录失效链接 {key}: {reason}")
+        return reason
+
+    def call(self, key: str, func: Callable, *args, **kwargs) -> Dict:
+        """
+        执行 func(*args, **kwargs)，已知失效的key直接抛出上次的错误
+
+        func 抛出异常或返回 status 为 error 的结果时按失败原因记录。
+        """
+        entry = self.get(key)
+        if entry is not None:
+            raise Exception(entry['error'])
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record(key, e)
+            raise
+        if isinstance(result, dict) and result.get('status') == 'error':
+            self.record(key, result.get('error', ''))
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits}
+
+
+_cache: Optional[NegativeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_negative_cache() -> NegativeCache:
+    """获取全局共享的失效链接缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = NegativeCache(Config.NEGATIVE_CACHE_TTLS, Config.NEGATIVE_CACHE_SIZE)
+    return _cache
@@ -0,0 +1,54 @@
+import re
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+# 各平台从URL中提取视频ID的规则
+VIDEO_ID_PATTERNS = {
+    'bilibili': [r'/video/(BV[0-9A-Za-z]{10})', r'/video/(av\d+)'],
+    'youtube': [r'[?&]v=([\w-]{11})', r'youtu\.be/([\w-]{11})', r'/shorts/([\w-]{11})'],
+    'douyin/tiktok': [r'/video/(\d+)', r'[?&]modal_id=(\d+)'],
+    'twitter': [r'/status/(\d+)'],
+    'kuaishou': [r'/short-video/([^/?#]+)', r'[?&]photoId=([^&#]+)'],
+    'xiaohongshu': [r'/(?:explore|discovery/item|item)/([0-9a-zA-Z]{24})'],
+}
+
+
+def detect_platform(url: str) -> str:
+    """检测视频平台"""
+    domain = urlparse(url).netloc.lower()
+
+    if 'douyin.com' in domain or 'tiktok.com' in domain:
+        return 'douyin/tiktok'
+    elif 'bilibili.com' in domain or 'b23.tv' in domain:
+        return 'bilibili'
+    elif 'youtube.com' in domain or 'youtu.be' in domain:
+        return 'youtube'
+    elif 'twitter.com' in domain or 'x.com' in domain:
+        return 'twitter'
+    elif 'kuaishou.com' in domain:
+        return 'kuaishou'
+    elif 'xiaohongshu.com' in domain or 'xhslink.com' in domain:
+        return 'xiaohongshu'
+    else:
+        return 'unsupported'
+
+
+def canonical_key(url: str) -> Optional[str]:
+    """
+    根据URL计算视频的规范标识，形如 "bilibili:BV1xx411c7mD"
+
+    同一视频的不同链接形式（追踪参数、移动端/PC端）得到相同的标识，
+    无法识别视频ID时返回None。
+    """
+    platform = detect_platform(url)
+    for pattern in VIDEO_ID_PATTERNS.get(platform, []):
+        match = re.search(pattern, url)
+        if match:
+            key = f"{platform}:{match.group(1)}"
+            # B站多P视频的分集是不同的视频
+            if platform == 'bilibili':
+                page = parse_qs(urlparse(url).query).get('p')
+                if page and page[0] not in ('', '1'):
+                    key += f":p{page[0]}"
+            return key
+    return None
@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from . import cancellation
+
+# 同一子任务两次进度事件之间的最小间隔（秒），状态变化不受限制
+PUBLISH_INTERVAL = 0.5
+
+_context = threading.local()
+
+
+class ProgressBroker:
+    """
+    任务进度广播
+
+    记录每个任务中每个URL的最新进度，并推送给所有订阅者（SSE连接）。
+    新订阅者会先收到当前快照，再收到后续的增量事件。
+    """
+
+    def __init__(self):
+        self._latest: Dict[str, Dict[int, Dict]] = {}
+        self._final: Dict[str, Dict] = {}
+        self._subscribers: Dict[str, list] = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, Dict], None]):
+        """注册监听函数 listener(job_id, event)，每个发布的事件都会调用"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def publish(self, job_id: str, event: Dict):
+        """发布事件，progress/item 类事件会记入快照"""
+        with self._lock:
+            if event.get('type') in ('progress', 'item'):
+                latest = self._latest.setdefault(job_id, {}).setdefault(event['index'], {})
+                latest.update(event)
+                latest['type'] = 'progress'
+            subscribers = list(self._subscribers.get(job_id, []))
+            listeners = list(self._listeners)
+        for q in subscribers:
+            q.put(event)
+        for listener in listeners:
+            listener(job_id, event)
+
+    def close(self, job_id: str, event: Dict):
+        """任务结束，发布最终事件并通知订阅者退出"""
+        with self._lock:
+            self._final[job_id] = event
+        self.publish(job_id, event)
+
+    def discard(self, job_id: str):
+        """释放已过期任务的进度记录"""
+        with self._lock:
+            self._latest.pop(job_id, None)
+            self._final.pop(job_id, None)
+
+    def snapshot(self, job_id: str) -> list:
+        """每个URL的最新进度"""
+        with self._lock:
+            items = self._latest.get(job_id, {})
+            return [dict(items[index]) for index in sorted(items)]
+
+    def subscribe(self, job_id: str, keepalive: float = 15.0,
+                  final_event: Optional[Callable[[], Optional[Dict]]] = None) -> Iterator[Optional[Dict]]:
+        """
+        订阅任务事件，任务结束后生成器退出
+
+        任务已结束时先回放快照和最终事件再退出。长时间没有事件时产出None，调用方可据此发送保活注释；
+        提供 final_event 时每次保活前调用，返回最终事件（如从存储中读到任务已结束）则产出后退出，
+        避免错过广播的订阅者一直等待。
+        """
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(q)
+            items = self._latest.get(job_id, {})
+            initial = [dict(items[index]) for index in sorted(items)]
+            final = self._final.get(job_id)
+
+        try:
+            for event in initial:
+                yield event
+            if final is not None:
+                yield final
+                return
+
+            while True:
+                try:
+                    event = q.get(timeout=keepalive)
+                except queue.Empty:
+                    final = final_event() if final_event is not None else None
+                    if final is not None:
+                        yield final
+                        return
+                    yield None
+                    continue
+                yield event
+                if event.get('type') == 'done':
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id, [])
+                if q in subscribers:
+                    subscribers.remove(q)
+                if not subscribers:
+                    self._subscribers.pop(job_id, None)
+
+
+_broker: Optional[ProgressBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_progress_broker() -> ProgressBroker:
+    """获取全局共享的进度广播器"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = ProgressBroker()
+    return _broker
+
+
+@contextmanager
+def bind(job_id: str, index: int):
+    """将当前线程绑定到任务的某个子项，期间的进度上报都归属于该子项"""
+    _context.job = (job_id, index)
+    _context.last_publish = 0.0
+    try:
+        yield
+    finally:
+        _context.job = None
+
+
+def report(stage: str, status: str = 'running', downloaded_bytes: Optional[int] = None,
+           total_bytes: Optional[int] = None, speed: Optional[float] = None, eta: Optional[float] = None):
+    """
+    上报当前子项的进度，未绑定任务时忽略
+
+    同时作为取消检查点：当前子任务已取消时抛出 JobCancelled。
+
+    Args:
+        stage: 处理阶段，如 download / audio / transcode / frame
+        status: running / finished / error
+        downloaded_bytes: 已下载字节数
+        total_bytes: 总字节数（未知时为None）
+        speed: 速度（字节/秒）
+        eta: 预计剩余秒数
+    """
+    cancellation.check()
+
+    job = getattr(_context, 'job', None)
+    if job is None:
+        return
+
+    now = time.monotonic()
+    if status == 'running' and now - _context.last_publish < PUBLISH_INTERVAL:
+        return
+    _context.last_publish = now
+
+    job_id, index = job
+    get_progress_broker().publish(job_id, {
+        'type': 'progress',
+        'index': index,
+        'stage': stage,
+        'status': status,
+        'downloaded_bytes': downloaded_bytes,
+        'total_bytes': total_bytes,
+        'speed': speed,
+        'eta': eta,
+        'updated_at': time.time()
+    })
+
+
+def ytdlp_hook(stage: str = 'download'):
+    """生成yt-dlp的progress_hooks回调，将下载进度上报到当前绑定的子项"""
+    def hook(d: Dict):
+        # 登记输出文件，任务取消时删除
+        cancellation.track(d.get('tmpfilename'))
+        cancellation.track(d.get('filename'))
+
+        status = d.get('status')
+        if status == 'downloading':
+            report(stage, 'running',
+                   downloaded_bytes=d.get('downloaded_bytes'),
+                   total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+                   speed=d.get('speed'),
+                   eta=d.get('eta'))
+        elif status == 'finished':
+            report(stage, 'finished',
+                   downloaded_bytes=d.get('downloaded_bytes') or d.get('total_bytes'),
+                   total_bytes=d.get('total_bytes') or d.get('downloaded_bytes'))
+        elif status == 'error':
+            report(stage, 'error')
+    return hook
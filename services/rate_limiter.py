@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+
+from config import Config
+
+# 平台返回这些状态时视为被限流
+# YouTube 的 "Sign in to confirm you're not a bot" 是针对请求频率的风控，同样按限流处理
+THROTTLE_MARKERS = ('http error 429', 'http error 403', 'too many requests', '403 forbidden', 'not a bot')
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，burst为桶容量"""
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """获取一个令牌，令牌不足时阻塞等待，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def penalize(self, factor: float = 0.5, min_ratio: float = 0.1):
+        """被限流时降低速率并清空令牌（乘性减）"""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.base_rate * min_ratio, self.rate * factor)
+            self._tokens = 0
+
+    def reward(self, step_ratio: float = 0.1):
+        """请求成功时逐步恢复速率（加性增）"""
+        with self._lock:
+            if self.rate < self.base_rate:
+                self._refill()
+                self.rate = min(self.base_rate, self.rate + self.base_rate * step_ratio)
+
+
+class RateLimiter:
+    """按平台划分的自适应限流器，所有服务共享"""
+
+    def __init__(self, limits: Dict[str, Dict]):
+        self._limits = limits
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, platform: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(platform)
+            if bucket is None:
+                limit = self._limits.get(platform) or self._limits['default']
+                bucket = TokenBucket(limit['rate'], limit['burst'])
+                self._buckets[platform] = bucket
+            return bucket
+
+    def acquire(self, platform: str, timeout: Optional[float] = None) -> bool:
+        """在访问平台前获取令牌"""
+        return self._bucket(platform).acquire(timeout)
+
+    def report_throttled(self, platform: str):
+        """平台返回429/403时调用，降低该平台速率"""
+        bucket = self._bucket(platform)
+        bucket.penalize()
+        logger.warning(f"{platform} 触发限流，速率降至 {bucket.rate:.2f} 次/秒")
+
+    def report_success(self, platform: str):
+        """请求成功时调用，逐步恢复该平台速率"""
+        self._bucket(platform).reward()
+
+    def report_result(self, platform: str, error: Optional[str] = None):
+        """根据错误信息自动判断是否被限流"""
+        if error and is_throttle_error(error):
+            self.report_throttled(platform)
+        elif not error:
+            self.report_success(platform)
+
+
+def is_throttle_status(status_code: int) -> bool:
+    """判断HTTP状态码是否为平台限流"""
+    return status_code in (403, 429)
+
+
+def is_throttle_error(error) -> bool:
+    """判断异常或错误信息是否为平台限流（429/403）"""
+    message = str(error).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取全局共享的限流器"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(Config.RATE_LIMITS)
+    return _rate_limiter
@@ -0,0 +1,109 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+# 优先级类别，数值越小越优先
+PRIORITY_PROBE = 0       # 元数据探测（test_bilibili / check_bilibili_video）
+PRIORITY_THUMBNAIL = 1   # 封面提取
+PRIORITY_BGM = 2         # BGM提取
+PRIORITY_DOWNLOAD = 3    # 完整视频下载
+
+PRIORITY_NAMES = {
+    PRIORITY_PROBE: 'probe',
+    PRIORITY_THUMBNAIL: 'thumbnail',
+    PRIORITY_BGM: 'bgm',
+    PRIORITY_DOWNLOAD: 'download',
+}
+
+
+class _Task:
+    __slots__ = ('priority', 'enqueued_at', 'seq', 'future', 'func', 'args', 'kwargs')
+
+    def __init__(self, priority, seq, future, func, args, kwargs):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.seq = seq
+        self.future = future
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+
+class PriorityScheduler:
+    """
+    带优先级的线程池
+
+    - 通用工作线程总是取有效优先级最高的任务；任务每等待 aging_seconds 秒，
+      有效优先级提升一级，保证下载等重任务不会被持续到达的轻任务饿死。
+    - 预留工作线程只执行元数据探测，封面提取同样要下载视频，不占用预留线程；
+      重任务占满通用线程时探测请求仍能立即执行。
+    """
+
+    def __init__(self, workers: int, reserved_workers: int = 1, aging_seconds: float = 30.0,
+                 initializer: Optional[Callable] = None, thread_name_prefix: str = 'fastmedia-io'):
+        self.aging_seconds = aging_seconds
+        self._initializer = initializer
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        for i in range(workers):
+            self._start_worker(f'{thread_name_prefix}-{i}', None)
+        for i in range(reserved_workers):
+            self._start_worker(f'{thread_name_prefix}-light-{i}', PRIORITY_PROBE)
+
+    def _start_worker(self, name: str, max_priority: Optional[int]):
+        thread = threading.Thread(target=self._worker, args=(max_priority,), name=name, daemon=True)
+        thread.start()
+
+    def submit(self, func: Callable, *args, priority: int = PRIORITY_DOWNLOAD, **kwargs) -> Future:
+        """提交任务，接口与 Executor.submit 兼容，额外支持 priority 参数"""
+        future = Future()
+        with self._cond:
+            self._queue.append(_Task(priority, next(self._seq), future, func, args, kwargs))
+            self._cond.notify_all()
+        return future
+
+    def queued(self) -> Dict[str, int]:
+        """各优先级类别排队中的任务数"""
+        with self._cond:
+            counts = {name: 0 for name in PRIORITY_NAMES.values()}
+            for task in self._queue:
+                name = PRIORITY_NAMES.get(task.priority, str(task.priority))
+                counts[name] = counts.get(name, 0) + 1
+            return counts
+
+    def _take(self, max_priority: Optional[int]) -> Optional[_Task]:
+        """取出有效优先级最高的任务，调用方需持有锁"""
+        now = time.monotonic()
+        best = None
+        best_rank = None
+        for task in self._queue:
+            if max_priority is not None and task.priority > max_priority:
+                continue
+            effective = task.priority - (now - task.enqueued_at) / self.aging_seconds
+            rank = (effective, task.seq)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = task, rank
+        if best is not None:
+            self._queue.remove(best)
+        return best
+
+    def _worker(self, max_priority: Optional[int]):
+        if self._initializer:
+            self._initializer()
+        while True:
+            with self._cond:
+                task = self._take(max_priority)
+                while task is None:
+                    self._cond.wait()
+                    task = self._take(max_priority)
+
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                task.future.set_result(task.func(*task.args, **task.kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
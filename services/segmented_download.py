@@ -0,0 +1,331 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config import Config
+from . import cancellation, progress
+
+# 等待分段线程时上报进度、检查取消的间隔（秒）
+POLL_INTERVAL = 0.5
+# 保存断点信息的间隔（秒）
+PERSIST_INTERVAL = 2.0
+# 从响应读取数据的块大小，写入磁盘前先在缓冲区中累积到 write_buffer
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _write_at(fd: int, data, offset: int, lock: threading.Lock):
+    """在指定偏移处写入，各分段线程共用同一个文件描述符"""
+    view = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    # Windows 没有 pwrite，定位和写入需要加锁
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+
+def _preallocate(fd: int, size: int):
+    """预先分配文件空间，减少碎片并尽早发现磁盘空间不足"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def _total_size(response) -> Optional[int]:
+    """从 Content-Range（206，或空文件的416 "bytes */0"）或 Content-Length（200）得到文件总大小"""
+    if response.status_code in (206, 416):
+        match = re.search(r'/(\d+)$', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def split_ranges(total: int, segments: int, min_segment_bytes: int) -> List[Tuple[int, int]]:
+    """把 [0, total) 划分为不超过 segments 段、每段不小于 min_segment_bytes 的闭区间"""
+    if total <= 0:
+        return []
+    count = max(1, min(segments, total // max(1, min_segment_bytes)))
+    size = -(-total // count)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _load_segments(state_path: str, part_path: str, validator: Dict) -> Optional[List[Dict]]:
+    """读取上次中断时保存的各段进度，文件已变化或断点信息无效时返回None"""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('validator') != validator or os.path.getsize(part_path) != validator['total']:
+            return None
+        return saved['segments']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_segments(state_path: str, validator: Dict, segments: List[Dict]):
+    """保存各段进度，先写临时文件再替换，避免中断时留下不完整的断点信息"""
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'validator': validator, 'segments': segments, 'updated_at': time.time()}, f)
+    os.replace(tmp_path, state_path)
+
+
+class _DownloadState:
+    """各分段线程共享的下载状态"""
+
+    def __init__(self, total: Optional[int]):
+        self.total = total
+        self.downloaded = 0
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        self.write_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def add(self, size: int):
+        with self._lock:
+            self.downloaded += size
+
+
+class SegmentedDownloader:
+    """
+    直链文件的多连接分段下载
+
+    先以 Range: bytes=0- 请求探测服务器是否支持分段：支持且文件足够大时，把文件划分为多个
+    字节区间，通过共享连接池并发下载，各段直接写入预分配文件的对应位置；不支持时退回单连接。
+    每段写入前在内存中累积到 write_buffer 字节，连接中断时从已写入的位置续传；
+    各段进度定期保存在 .part.json 中，worker退出或重试耗尽后，下次下载从断点继续。
+    """
+
+    def __init__(self, client, segments: int = 4, min_segment_bytes: int = 4 * 1024 ** 2,
+                 write_buffer: int = 1024 ** 2, retries: int = 3):
+        self.client = client
+        self.segments = max(1, segments)
+        self.min_segment_bytes = min_segment_bytes
+        self.write_buffer = write_buffer
+        self.retries = retries
+
+    def download(self, url: str, filepath: str, stage: str = 'download',
+                 on_response: Optional[Callable] = None, **request_kwargs) -> int:
+        """
+        下载 url 到 filepath，返回文件大小
+
+        下载过程中写入 filepath.part，并在 filepath.part.json 中记录各段已写入的位置；
+        中断后再次下载同一文件时，若服务器返回的大小和 ETag/Last-Modified 未变，则只请求缺少的部分。
+
+        Args:
+            url: 直链地址
+            filepath: 保存路径
+            stage: 上报进度使用的阶段名
+            on_response: 每个响应检查状态码前调用 on_response(response)，可用于识别限流
+            **request_kwargs: 传给 client.get 的其他参数（headers、verify、timeout 等）
+        """
+        headers = dict(request_kwargs.pop('headers', None) or {})
+        part_path = filepath + '.part'
+        state_path = part_path + '.json'
+        # 任务取消时删除已下载的部分和断点信息
+        cancellation.track(filepath)
+        cancellation.track(state_path)
+
+        response = self._get(url, headers, 'bytes=0-', on_response, request_kwargs)
+        total = _total_size(response)
+        if total == 0:
+            # 空文件：Range探测得到 416 "bytes */0" 或长度为0的响应，直接生成空文件
+            response.close()
+            open(filepath, 'wb').close()
+            _remove(part_path)
+            _remove(state_path)
+            progress.report(stage, 'finished', downloaded_bytes=0, total_bytes=0)
+            return 0
+        state = _DownloadState(total)
+        resumable = response.status_code == 206 and total is not None
+        validator = {
+            'total': total,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        segments = _load_segments(state_path, part_path, validator) if resumable else None
+
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if segments is None:
+            flags |= os.O_TRUNC
+        fd = os.open(part_path, flags, 0o644)
+        try:
+            if not resumable:
+                # 服务器不支持Range，只能单连接完整下载
+                segment = {'start': 0, 'end': None, 'cursor': 0}
+                tasks = [lambda: self._read_into(fd, response, segment, state)]
+                persist = None
+            else:
+                if segments is None:
+                    _preallocate(fd, total)
+                    segments = [
+                        {'start': start, 'end': end, 'cursor': start}
+                        for start, end in split_ranges(total, self.segments, self.min_segment_bytes)
+                    ]
+                    logger.debug(f"分段下载 {total} bytes，共 {len(segments)} 段")
+                state.downloaded = sum(segment['cursor'] - segment['start'] for segment in segments)
+                if state.downloaded:
+                    logger.info(f"断点续传 {filepath}: 已下载 {state.downloaded}/{total} bytes")
+
+                # 探测请求从0开始，可以直接作为尚未开始的第一段的响应
+                tasks = [
+                    lambda segment=segment: self._fetch(
+                        url, headers, fd, segment, state, on_response, request_kwargs,
+                        response if segment['cursor'] == 0 else None
+                    )
+                    for segment in segments if segment['cursor'] <= segment['end']
+                ]
+                persist = lambda: _save_segments(state_path, validator, segments)
+            self._run(tasks, state, stage, persist)
+        except BaseException:
+            if resumable and segments is not None:
+                # 保留已下载的部分，下次从断点继续
+                _save_segments(state_path, validator, segments)
+            raise
+        finally:
+            os.close(fd)
+            response.close()
+
+        os.replace(part_path, filepath)
+        _remove(state_path)
+        progress.report(stage, 'finished', downloaded_bytes=state.downloaded, total_bytes=state.downloaded)
+        return state.downloaded
+
+    def _get(self, url: str, headers: Dict, byte_range: str, on_response, request_kwargs: Dict):
+        # 禁止压缩，否则字节偏移对应的是压缩后的数据
+        headers = dict(headers, Range=byte_range)
+        headers['Accept-Encoding'] = 'identity'
+        response = self.client.get(url, headers=headers, stream=True, **request_kwargs)
+        if on_response is not None:
+            on_response(response)
+        if response.status_code == 416 and _total_size(response) == 0:
+            # 对空文件的任何Range请求都无法满足，服务器以 Content-Range: bytes */0 说明文件大小
+            return response
+        response.raise_for_status()
+        return response
+
+    def _run(self, tasks: List[Callable], state: _DownloadState, stage: str, persist: Optional[Callable] = None):
+        """在独立线程中执行各段，当前线程上报合并后的进度、检查取消，并定期调用 persist 保存断点"""
+        def run(task):
+            try:
+                task()
+            except BaseException as e:
+                state.errors.append(e)
+                state.stop.set()
+
+        threads = [threading.Thread(target=run, args=(task,), daemon=True) for task in tasks]
+        for thread in threads:
+            thread.start()
+
+        started_at = last_persist = time.monotonic()
+        initial = state.downloaded
+        try:
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(POLL_INTERVAL)
+                now = time.monotonic()
+                if persist is not None and now - last_persist >= PERSIST_INTERVAL:
+                    persist()
+                    last_persist = now
+                elapsed = now - started_at
+                speed = (state.downloaded - initial) / elapsed if elapsed > 0 else None
+                eta = (state.total - state.downloaded) / speed if speed and state.total else None
+                progress.report(stage, downloaded_bytes=state.downloaded, total_bytes=state.total,
+                                speed=speed, eta=eta)
+        except BaseException:
+            # 任务取消等情况下通知各段尽快退出
+            state.stop.set()
+            for thread in threads:
+                thread.join()
+            raise
+
+        if state.errors:
+            raise state.errors[0]
+
+    def _fetch(self, url: str, headers: Dict, fd: int, segment: Dict, state: _DownloadState,
+               on_response, request_kwargs: Dict, response=None):
+        """下载一段，连接中断时从已写入的位置重新请求"""
+        for attempt in range(self.retries + 1):
+            try:
+                if response is None:
+                    byte_range = f"bytes={segment['cursor']}-{segment['end']}"
+                    response = self._get(url, headers, byte_range, on_response, request_kwargs)
+                    if response.status_code != 206:
+                        raise Exception('服务器不支持分段下载')
+                self._read_into(fd, response, segment, state)
+                if segment['cursor'] > segment['end'] or state.stop.is_set():
+                    return
+                raise IOError(f"分段 {segment['start']}-{segment['end']} 未下载完整")
+            except Exception as e:
+                if state.stop.is_set() or attempt == self.retries:
+                    raise
+                logger.warning(f"分段下载中断，从 {segment['cursor']} 处重试: {e}")
+            finally:
+                if response is not None:
+                    response.close()
+                    response = None
+
+    def _read_into(self, fd: int, response, segment: Dict, state: _DownloadState):
+        """
+        把响应写入文件 segment['cursor'] 起的位置，读到 segment['end']（含）或响应结束为止
+
+        cursor 随每次写入前移，连接中断时据此从已写入的位置续传，并作为断点保存。
+        """
+        buffer = bytearray()
+        end = segment['end']
+
+        def flush():
+            _write_at(fd, buffer, segment['cursor'], state.write_lock)
+            segment['cursor'] += len(buffer)
+            state.add(len(buffer))
+            buffer.clear()
+
+        try:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if state.stop.is_set():
+                    break
+                if not chunk:
+                    continue
+                if end is not None:
+                    chunk = chunk[:end + 1 - segment['cursor'] - len(buffer)]
+                buffer += chunk
+                if len(buffer) >= self.write_buffer:
+                    flush()
+                if end is not None and segment['cursor'] + len(buffer) > end:
+                    break
+        finally:
+            if buffer:
+                flush()
+
+
+def create_segmented_downloader(client) -> SegmentedDownloader:
+    """按配置创建使用指定HTTP客户端的分段下载器"""
+    return SegmentedDownloader(
+        client,
+        segments=Config.DOWNLOAD_SEGMENTS,
+        min_segment_bytes=Config.DOWNLOAD_MIN_SEGMENT_BYTES,
+        write_buffer=Config.DOWNLOAD_WRITE_BUFFER
+    )
@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from . import cancellation
+
+# 跟随者等待期间检查自身取消令牌的间隔（秒）
+WAIT_INTERVAL = 0.5
+
+
+class _Call:
+    """一次正在执行的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # 执行者的子任务被取消时，结果不能共享给其他请求
+        self.cancelled = False
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求
+
+    同一个key同时只执行一次func，期间到达的相同请求等待这次执行并共享其结果或异常。
+    执行结束后key即被释放，之后的请求会重新执行。
+
+    执行者所在的子任务被取消时，等待者不共享这次的结果（取消错误或即将被清理的文件），
+    而是重新发起调用，由其中一个成为新的执行者；等待者等待期间也会响应自身的取消。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    leader = False
+                else:
+                    call = _Call()
+                    self._calls[key] = call
+                    leader = True
+
+            if leader:
+                return self._lead(key, call, func, *args, **kwargs)
+
+            while not call.done.wait(WAIT_INTERVAL):
+                cancellation.check()
+            if call.cancelled:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def _lead(self, key: Hashable, call: _Call, func: Callable, *args, **kwargs) -> Any:
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            token = cancellation.current()
+            call.cancelled = token is not None and token.cancelled
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """当前正在执行的key数量"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from loguru import logger
+
+from config import Config
+
+
+class _Directory:
+    """一个受配额管理的目录：文件路径 -> 大小，按最近访问时间从旧到新排列"""
+
+    def __init__(self, path: str, quota: int):
+        self.path = path
+        self.quota = quota
+        self.files: OrderedDict = OrderedDict()
+        self.access: Dict[str, float] = {}
+        self.used = 0
+
+
+class StorageManager:
+    """
+    临时目录配额管理
+
+    每个目录设置字节配额，在内存中按最近访问时间维护文件索引。产物生成时登记、被下载时刷新访问时间、
+    被删除时移除，后台线程在目录超出配额时从最久未访问的文件开始删除，淘汰时不遍历目录。
+
+    没有经过登记的文件（yt-dlp 的 .part 文件、分段下载的 .part.json、失败任务残留的文件、
+    其他进程生成的文件）由间隔很长的对账扫描（reconcile_interval）补入索引，同时移除已不存在的文件。
+    touch() 同时刷新文件的 atime（不改动mtime，ETag保持不变），淘汰前再检查一次文件的 atime/mtime，
+    其他进程刚访问或仍在写入的文件不会按索引中过时的时间被删除。
+    最近 grace_seconds 秒内访问过的文件不会被淘汰，避免删除刚生成、尚未下载的产物。
+    """
+
+    def __init__(self, interval: float = 60, grace_seconds: float = 300, reconcile_interval: float = 3600):
+        self.interval = interval
+        self.grace_seconds = grace_seconds
+        self.reconcile_interval = reconcile_interval
+        self._dirs: Dict[str, _Directory] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_directory(self, path: str, quota: int):
+        """纳入配额管理，并扫描一次目录建立初始索引"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._dirs:
+                return
+            directory = _Directory(path, quota)
+            self._dirs[path] = directory
+
+        self.reconcile(directory)
+        if directory.used > quota:
+            self._wakeup.set()
+
+    def register(self, path: str):
+        """登记新生成的文件"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        path = os.path.abspath(path)
+        with self._lock:
+            directory = self._directory_of(path)
+            if directory is None:
+                return
+            self._remove(directory, path)
+            self._add(directory, path, size, time.time())
+            over_quota = directory.used > directory.quota
+        if over_quota:
+            self._wakeup.set()
+
+    def touch(self, path: str):
+        """文件被访问（下载）时调用，刷新其在LRU中的位置和文件的atime"""
+        path = os.path.abspath(path)
+        now = time.time()
+        try:
+            os.utime(path, (now, os.stat(path).st_mtime))
+        except OSError as e:
+            logger.debug(f"刷新文件访问时间失败 {path}: {e}")
+        with self._lock:
+            directory = self._directory_of(path)
+            if directory is not None and path in directory.files:
+                directory.files.move_to_end(path)
+                directory.access[path] = now
+
+    def forget(self, path: str):
+        """文件已被删除时调用"""
+        path = os.path.abspath(path)
+        with self._lock:
+            directory = self._directory_of(path)
+            if directory is not None:
+                self._remove(directory, path)
+
+    def manages(self, path: str) -> bool:
+        """文件是否位于受管目录内（解析符号链接后判断），用于校验客户端提供的路径"""
+        real_path = os.path.realpath(path)
+        with self._lock:
+            roots = [os.path.realpath(root) for root in self._dirs]
+        return any(real_path.startswith(root + os.sep) for root in roots)
+
+    def usage(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                d.path: {'used': d.used, 'quota': d.quota, 'files': len(d.files)}
+                for d in self._dirs.values()
+            }
+
+    def start(self):
+        """启动后台淘汰线程"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='fastmedia-storage', daemon=True)
+        self._thread.start()
+
+    def enforce(self):
+        """按索引淘汰各目录中超出配额的文件"""
+        for directory in list(self._dirs.values()):
+            while True:
+                with self._lock:
+                    victim = self._next_victim(directory)
+                    if victim is None:
+                        break
+                    recorded = directory.access[victim]
+                try:
+                    stat = os.stat(victim)
+                except OSError:
+                    # 已被其他途径删除
+                    self.forget(victim)
+                    continue
+
+                accessed_at = max(stat.st_atime, stat.st_mtime)
+                if accessed_at > recorded:
+                    # 其他进程访问过或仍在写入，按实际时间重新排队
+                    with self._lock:
+                        self._remove(directory, victim)
+                        self._add(directory, victim, stat.st_size, accessed_at)
+                    continue
+
+                try:
+                    os.remove(victim)
+                    logger.info(f"存储配额淘汰: {victim}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"删除文件失败 {victim}: {e}")
+                    break
+                self.forget(victim)
+
+    def reconcile(self, directory: _Directory):
+        """扫描目录，补入未登记的文件、移除已不存在的文件，访问时间取索引与文件atime/mtime中较新者"""
+        entries = []
+        for root, dirs, files in os.walk(directory.path):
+            # 单独纳入管理的子目录按自己的配额处理
+            dirs[:] = [name for name in dirs if os.path.join(root, name) not in self._dirs]
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), file_path, stat.st_size))
+
+        with self._lock:
+            access = directory.access
+            entries = sorted((max(accessed_at, access.get(path, 0)), path, size) for accessed_at, path, size in entries)
+            directory.files.clear()
+            directory.access = {}
+            directory.used = 0
+            for accessed_at, path, size in entries:
+                self._add(directory, path, size, accessed_at)
+
+    def _run(self):
+        last_reconcile = time.monotonic()
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    for directory in list(self._dirs.values()):
+                        self.reconcile(directory)
+                    last_reconcile = time.monotonic()
+                self.enforce()
+            except Exception as e:
+                logger.error(f"存储配额检查失败: {e}")
+
+    def _next_victim(self, directory: _Directory) -> Optional[str]:
+        """最久未访问、且不在保护期内的文件，未超出配额时返回None，调用方需持有锁"""
+        if directory.used <= directory.quota or not directory.files:
+            return None
+        path = next(iter(directory.files))
+        if directory.access[path] > time.time() - self.grace_seconds:
+            return None
+        return path
+
+    def _directory_of(self, path: str) -> Optional[_Directory]:
+        """文件所属的受管目录，调用方需持有锁"""
+        parent = os.path.dirname(path)
+        while True:
+            directory = self._dirs.get(parent)
+            if directory is not None:
+                return directory
+            upper = os.path.dirname(parent)
+            if upper == parent:
+                return None
+            parent = upper
+
+    def _add(self, directory: _Directory, path: str, size: int, accessed_at: float):
+        directory.files[path] = size
+        directory.access[path] = accessed_at
+        directory.used += size
+
+    def _remove(self, directory: _Directory, path: str):
+        size = directory.files.pop(path, None)
+        if size is not None:
+            directory.access.pop(path, None)
+            directory.used -= size
+
+
+_manager: Optional[StorageManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """获取全局共享的存储配额管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = StorageManager(Config.STORAGE_CHECK_INTERVAL, Config.STORAGE_EVICT_GRACE_SECONDS,
+                                          Config.STORAGE_RECONCILE_INTERVAL)
+    return _manager
@@ -0,0 +1,187 @@
+import os
+import queue
+import threading
+import uuid
+from typing import Dict, Iterator, Optional
+
+import yt_dlp
+from loguru import logger
+
+from .http_client import get_http_session
+from .media_cache import get_media_cache, media_cache_key
+from .platforms import detect_platform
+from .rate_limiter import get_rate_limiter
+from .ytdlp_pool import get_ytdlp_pool
+
+# 只选择音视频合一、可直接通过HTTP读取的单一格式，分离的DASH流无法边下边传
+STREAM_FORMAT = (
+    'best[height<=720][vcodec!=none][acodec!=none][protocol^=http]'
+    '/best[vcodec!=none][acodec!=none][protocol^=http]'
+)
+STREAM_YDL_OPTS = {'quiet': True, 'no_warnings': True, 'format': STREAM_FORMAT, 'noplaylist': True}
+# 从上游读取数据的块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class CacheTee:
+    """
+    把转发给客户端的数据同时写入媒体缓存
+
+    写盘在独立线程中进行，转发线程只把数据放入有界队列；队列已满（磁盘跟不上）时放弃写入缓存，
+    转发不会因写盘而阻塞。数据完整时加入媒体缓存，否则删除临时文件。
+    """
+
+    def __init__(self, cache_key: str, temp_dir: str, ext: str, expected_size: Optional[int],
+                 max_pending: int = 64):
+        self.cache_key = cache_key
+        self.expected_size = expected_size
+        self.path = os.path.join(temp_dir, f"stream-{uuid.uuid4().hex}.{ext}")
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._abandoned = False
+        self._finished = False
+        self._thread = threading.Thread(target=self._write, name='fastmedia-stream-tee', daemon=True)
+        self._thread.start()
+
+    def feed(self, chunk: bytes):
+        if self._abandoned:
+            return
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            logger.warning(f"缓存写入跟不上转发速度，放弃缓存: {self.cache_key}")
+            self.abort()
+
+    def finish(self):
+        """上游数据已全部转发"""
+        self._finished = True
+        self._put_marker(True)
+
+    def abort(self):
+        """客户端断开或上游出错，丢弃已写入的数据"""
+        self._abandoned = True
+        self._put_marker(False)
+
+    def _put_marker(self, complete: bool):
+        # 标记只用于及时唤醒写盘线程；队列满时不阻塞转发线程，
+        # 写盘线程取完队列后会根据 _finished / _abandoned 结束
+        try:
+            self._queue.put_nowait(complete)
+        except queue.Full:
+            pass
+
+    def _write(self):
+        written = 0
+        complete = False
+        try:
+            with open(self.path, 'wb') as f:
+                while True:
+                    try:
+                        item = self._queue.get(timeout=1)
+                    except queue.Empty:
+                        # 数据在 finish() 之前入队，队列为空说明已全部写入
+                        if self._abandoned or self._finished:
+                            complete = not self._abandoned
+                            break
+                        continue
+                    if isinstance(item, bool):
+                        complete = item and not self._abandoned
+                        break
+                    if self._abandoned:
+                        break
+                    f.write(item)
+                    written += len(item)
+            if complete and (self.expected_size is None or written == self.expected_size):
+                get_media_cache().store(self.cache_key, self.path)
+        except OSError as e:
+            logger.warning(f"写入媒体缓存失败 {self.cache_key}: {e}")
+        finally:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class StreamProxy:
+    """
+    边下边传：解析出单一的渐进式格式后，把上游数据直接转发给客户端
+
+    首字节时间只取决于解析和建立上游连接，不需要等整个文件下载到临时目录。
+    完整（非Range）请求可以同时写入媒体缓存，之后的请求直接从缓存读取。
+    """
+
+    def __init__(self, temp_dir: str, tee_queue_size: int = 64):
+        self.temp_dir = temp_dir
+        self.tee_queue_size = tee_queue_size
+        self.media_cache = get_media_cache()
+
+    def resolve(self, url: str) -> Dict:
+        """
+        解析可直接转发的格式
+
+        Returns:
+            dict: title / ext / stream_url / http_headers / filesize / cache_key / cached，
+                  命中媒体缓存时 cached 为缓存条目
+        """
+        platform = detect_platform(url)
+        if platform == 'unsupported':
+            raise ValueError(f'不支持的平台: {url}')
+
+        rate_limiter = get_rate_limiter()
+        rate_limiter.acquire(platform)
+        try:
+            with get_ytdlp_pool().checkout(STREAM_YDL_OPTS) as ydl:
+                info = ydl.extract_info(url, download=False)
+        except yt_dlp.utils.DownloadError as e:
+            rate_limiter.report_result(platform, str(e))
+            if 'requested format is not available' in str(e).lower():
+                raise ValueError('该视频没有可边下边传的格式，请使用普通下载')
+            raise
+        rate_limiter.report_success(platform)
+
+        if info is None or info.get('requested_formats') or not info.get('url'):
+            raise ValueError('该视频没有可边下边传的格式，请使用普通下载')
+
+        cache_key = media_cache_key(platform, info, STREAM_FORMAT)
+        return {
+            'title': info.get('title', 'unknown'),
+            'extractor': info.get('extractor', platform),
+            'ext': info.get('ext', 'mp4'),
+            'stream_url': info['url'],
+            'http_headers': info.get('http_headers') or {},
+            'filesize': info.get('filesize'),
+            'cache_key': cache_key,
+            'cached': self.media_cache.lookup(cache_key),
+        }
+
+    def open(self, stream: Dict, range_header: Optional[str] = None):
+        """打开上游连接，客户端的Range请求原样转发，便于播放器拖动进度"""
+        headers = dict(stream['http_headers'])
+        # 原样转发字节，Content-Length 与上游保持一致
+        headers['Accept-Encoding'] = 'identity'
+        if range_header:
+            headers['Range'] = range_header
+        response = get_http_session().get(stream['stream_url'], headers=headers, stream=True)
+        response.raise_for_status()
+        return response
+
+    def iter_body(self, stream: Dict, response, tee_to_cache: bool) -> Iterator[bytes]:
+        """逐块转发上游数据，tee_to_cache 时只对完整响应（200）写入缓存"""
+        tee = None
+        if tee_to_cache and response.status_code == 200 and stream['cache_key']:
+            length = response.headers.get('Content-Length')
+            tee = CacheTee(stream['cache_key'], self.temp_dir, stream['ext'],
+                           int(length) if length and length.isdigit() else None, self.tee_queue_size)
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if chunk:
+                    if tee is not None:
+                        tee.feed(chunk)
+                    yield chunk
+            if tee is not None:
+                tee.finish()
+                tee = None
+        finally:
+            # 客户端中途断开（GeneratorExit）或上游出错
+            if tee is not None:
+                tee.abort()
+            response.close()
@@ -1,10 +1,22 @@
 import os
-import yt_dlp
-from moviepy.editor import VideoFileClip
 from PIL import Image
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import tempfile
-import requests
+from config import Config
+from . import progress
+from .executor import map_ordered, run_cpu
+from .http_client import HttpClient
+from .segmented_download import create_segmented_downloader
+from .scheduler import PRIORITY_THUMBNAIL
+from .media_processing import extract_frame, build_thumbnail_grid
+from .media_cache import get_media_cache, media_cache_key
+from .metadata_cache import downloaded_filepath, extract_and_download
+from .negative_cache import get_negative_cache
+from .platforms import detect_platform, canonical_key
+from .rate_limiter import get_rate_limiter
+from .single_flight import SingleFlight
+from .storage_manager import get_storage_manager
+from .ytdlp_pool import get_ytdlp_pool
 
 class ThumbnailExtractor:
     def __init__(self):
@@ -14,6 +26,7 @@ class ThumbnailExtractor:
         # 使用固定的临时目录，而不是每次创建新的
         self.temp_dir = os.path.join(tempfile.gettempdir(), 'fastmedia_thumbnail_temp')
         os.makedirs(self.temp_dir, exist_ok=True)
+        get_storage_manager().add_directory(self.temp_dir, Config.TEMP_DIR_QUOTA_BYTES)
 
         self.output_dir = 'downloads/thumbnails'  # 保留作为默认目录
         os.makedirs(self.output_dir, exist_ok=True)
@@ -23,73 +36,95 @@ class ThumbnailExtractor:
             'outtmpl': os.path.join(self.temp_dir, '%(title)s.%(ext)s'),
             'format': 'best[height<=720]',
             'writeinfojson': False,
+            'progress_hooks': [progress.ytdlp_hook('download')],
+            **Config.YTDLP_RESUME_OPTS,
         }
+
+        # 合并同一视频、同一时间点的并发提取请求
+        self.single_flight = SingleFlight()
+        self.negative_cache = get_negative_cache()
+        self.media_cache = get_media_cache()
+        self.ydl_pool = get_ytdlp_pool()
+        self.http = HttpClient()
+        self.downloader = create_segmented_downloader(self.http)
     
     def extract_batch(self, urls: List[str], timestamp: float = 0) -> List[Dict]:
-        """批量提取缩略图"""
-        results = []
-        
-        for url in urls:
-            try:
-                result = self.extract_single(url, timestamp)
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'url': url,
-                    'status': 'error',
-                    'error': str(e),
-                    'filepath': None
-                })
-        
-        return results
+        """批量提取缩略图，在共享线程池中并发执行，结果顺序与输入一致"""
+        return map_ordered(lambda url: self.extract_single(url, timestamp), urls, lambda url, e: {
+            'url': url,
+            'status': 'error',
+            'error': str(e),
+            'filepath': None
+        }, priority=PRIORITY_THUMBNAIL)
     
     def extract_single(self, url: str, timestamp: float = 0) -> Dict:
+        """提取单个视频的缩略图，相同请求并发时只执行一次并共享结果"""
+        key = canonical_key(url) or url
+        result = self.negative_cache.call(key, self.single_flight.do, ('thumbnail', key, timestamp), self._extract_single, url, timestamp)
+        return dict(result, url=url)
+
+    def _extract_single(self, url: str, timestamp: float = 0) -> Dict:
         """提取单个视频的缩略图"""
         temp_video_path = None
+        platform = detect_platform(url)
+        rate_limiter = get_rate_limiter()
         try:
-            # 首先尝试获取视频信息和原始缩略图
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'unknown')
-                thumbnail_url = info.get('thumbnail')
-                duration = info.get('duration', 0)
-            
-            # 如果请求的时间戳超过视频长度，使用视频长度的一半
-            if timestamp > duration:
-                timestamp = duration / 2 if duration > 0 else 0
-            
-            # 清理文件名
-            safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            extractor = info.get('extractor', 'unknown')
-            output_filename = f"{extractor}-{safe_title}_thumbnail.jpg"
-            temp_output_path = os.path.join(self.temp_dir, output_filename)
+            def lookup(info: Dict, use_thumbnail: bool = True):
+                # 只查询、不下载：时间戳为0且有原始缩略图时返回缩略图地址，否则返回本地已有的视频副本
+                # （如视频下载功能下载过）；都没有时返回None，由同一次提取的信息直接下载视频
+                thumbnail_url = self._thumbnail_url(info) if use_thumbnail and timestamp == 0 else None
+                if thumbnail_url:
+                    return {'method': 'original_thumbnail', 'thumbnail_url': thumbnail_url}
+                local_video = self.media_cache.find_video(platform, info.get('id'))
+                if local_video is not None:
+                    return {'method': 'video_frame', 'video': local_video['path']}
+                return None
+
+            # 只在需要请求平台时限流
+            with self.ydl_pool.checkout(self.ydl_opts) as ydl:
+                info, local = extract_and_download(ydl, url, platform=platform, lookup=lookup)
+            if info is None:
+                raise Exception('无法获取视频信息')
+            rate_limiter.report_success(platform)
 
-            # 如果时间戳为0且有原始缩略图，优先下载原始缩略图
-            if timestamp == 0 and thumbnail_url:
+            if local and local['method'] == 'original_thumbnail':
                 try:
-                    self.download_original_thumbnail(thumbnail_url, temp_output_path)
-                    return {
-                        'url': url,
-                        'status': 'success',
-                        'title': title,
-                        'temp_filepath': temp_output_path if os.path.exists(temp_output_path) else None,
-                        'download_filename': output_filename,
-                        'filesize': os.path.getsize(temp_output_path) if os.path.exists(temp_output_path) else 0,
-                        'timestamp': 0,
-                        'method': 'original_thumbnail',
-                        'platform': extractor
-                    }
-                except:
-                    # 如果下载原始缩略图失败，继续使用视频帧提取
-                    pass
+                    self.download_original_thumbnail(local['thumbnail_url'], self._output_path(info)[1])
+                except Exception:
+                    # 如果下载原始缩略图失败，改用视频帧提取（视频信息已缓存，命中本地视频时不再请求平台）
+                    with self.ydl_pool.checkout(self.ydl_opts) as ydl:
+                        info, local = extract_and_download(
+                            ydl, url, platform=platform, lookup=lambda video_info: lookup(video_info, use_thumbnail=False)
+                        )
+                    if info is None:
+                        raise Exception('无法获取视频信息')
 
-            # 下载视频并提取帧
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                ydl.download([url])
-                temp_video_path = os.path.join(self.temp_dir, f"{title}.{info.get('ext', 'mp4')}")
+            title = info.get('title', 'unknown')
+            extractor = info.get('extractor', 'unknown')
+            output_filename, temp_output_path = self._output_path(info)
 
-            # 从视频中提取帧
-            self.extract_frame_from_video(temp_video_path, temp_output_path, timestamp)
+            if local and local['method'] == 'original_thumbnail':
+                timestamp = 0
+            else:
+                # 如果请求的时间戳超过视频长度，使用视频长度的一半
+                duration = info.get('duration') or 0
+                if timestamp > duration:
+                    timestamp = duration / 2 if duration > 0 else 0
+
+                if local:
+                    # 已有本地视频副本时直接截帧，不再下载
+                    self.extract_frame_from_video(local['video'], temp_output_path, timestamp)
+                else:
+                    # 文件路径以yt-dlp记录的为准
+                    temp_video_path = downloaded_filepath(info)
+                    if temp_video_path is None:
+                        raise Exception('视频下载失败')
+
+                    # 登记到媒体缓存，之后同一视频的截帧和BGM提取可以直接使用
+                    self.media_cache.store(media_cache_key(platform, info, self.ydl_opts['format']), temp_video_path)
+
+                    # 从视频中提取帧
+                    self.extract_frame_from_video(temp_video_path, temp_output_path, timestamp)
 
             return {
                 'url': url,
@@ -99,11 +134,12 @@ class ThumbnailExtractor:
                 'download_filename': output_filename,
                 'filesize': os.path.getsize(temp_output_path) if os.path.exists(temp_output_path) else 0,
                 'timestamp': timestamp,
-                'method': 'video_frame',
+                'method': local['method'] if local else 'video_frame',
                 'platform': extractor
             }
             
         except Exception as e:
+            rate_limiter.report_result(platform, str(e))
             raise Exception(f'缩略图提取失败: {str(e)}')
 
         finally:
@@ -114,6 +150,19 @@ class ThumbnailExtractor:
                 except:
                     pass
 
+    @staticmethod
+    def _thumbnail_url(info: Dict) -> Optional[str]:
+        """视频信息中的原始缩略图地址，未经yt-dlp处理的信息中可能只有 thumbnails 列表"""
+        return info.get('thumbnail') or ((info.get('thumbnails') or [{}])[-1]).get('url')
+
+    def _output_path(self, info: Dict) -> Tuple[str, str]:
+        """缩略图的文件名和临时路径"""
+        title = info.get('title', 'unknown')
+        # 清理文件名
+        safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        output_filename = f"{info.get('extractor', 'unknown')}-{safe_title}_thumbnail.jpg"
+        return output_filename, os.path.join(self.temp_dir, output_filename)
+
     def cleanup_temp_file(self, filepath: str):
         """清理临时文件"""
         try:
@@ -141,11 +190,7 @@ class ThumbnailExtractor:
     def download_original_thumbnail(self, thumbnail_url: str, output_path: str):
         """下载原始缩略图"""
         try:
-            response = requests.get(thumbnail_url, timeout=10)
-            response.raise_for_status()
-            
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+            self.downloader.download(thumbnail_url, output_path, stage='thumbnail', timeout=10)
             
             # 验证图片是否有效
             with Image.open(output_path) as img:
@@ -155,27 +200,14 @@ class ThumbnailExtractor:
             raise Exception(f'原始缩略图下载失败: {str(e)}')
     
     def extract_frame_from_video(self, video_path: str, output_path: str, timestamp: float = 0):
-        """从视频中提取指定时间的帧"""
+        """从视频中提取指定时间的帧（在CPU进程池中解码和编码）"""
         try:
             if not os.path.exists(video_path):
                 raise Exception('视频文件不存在')
             
-            # 使用moviepy提取帧
-            video = VideoFileClip(video_path)
-            
-            # 确保时间戳在有效范围内
-            if timestamp > video.duration:
-                timestamp = video.duration / 2
-            
-            # 提取帧
-            frame = video.get_frame(timestamp)
-            
-            # 转换为PIL图像并保存
-            img = Image.fromarray(frame)
-            img.save(output_path, 'JPEG', quality=90)
-            
-            # 清理资源
-            video.close()
+            progress.report('frame')
+            run_cpu(extract_frame, video_path, output_path, timestamp, 90)
+            progress.report('frame', 'finished')
             
         except Exception as e:
             raise Exception(f'视频帧提取失败: {str(e)}')
@@ -186,14 +218,23 @@ class ThumbnailExtractor:
         results = []
         
         try:
-            # 下载视频
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'unknown')
-                duration = info.get('duration', 0)
-                
-                ydl.download([url])
-                temp_video_path = os.path.join(self.temp_dir, f"{title}.{info.get('ext', 'mp4')}")
+            # 下载视频（已有本地副本时直接使用），提取到的信息直接用于下载，不再重复提取
+            platform = detect_platform(url)
+            with self.ydl_pool.checkout(self.ydl_opts) as ydl:
+                info, local_video = extract_and_download(
+                    ydl, url, lookup=lambda info: self.media_cache.find_video(platform, info.get('id'))
+                )
+            if info is None:
+                raise Exception('无法获取视频信息')
+            title = info.get('title', 'unknown')
+            duration = info.get('duration', 0)
+
+            if local_video is not None:
+                video_path = local_video['path']
+            else:
+                temp_video_path = video_path = downloaded_filepath(info)
+                if video_path is None:
+                    raise Exception('视频下载失败')
             
             # 为每个时间戳提取帧
             for i, timestamp in enumerate(timestamps):
@@ -205,7 +246,7 @@ class ThumbnailExtractor:
                     output_filename = f"{self.sanitize_filename(title)}_frame_{i+1}_{int(timestamp)}s.jpg"
                     output_path = os.path.join(self.output_dir, output_filename)
                     
-                    self.extract_frame_from_video(temp_video_path, output_path, timestamp)
+                    self.extract_frame_from_video(video_path, output_path, timestamp)
                     
                     results.append({
                         'timestamp': timestamp,
@@ -259,48 +300,13 @@ class ThumbnailExtractor:
     
     def create_thumbnail_grid(self, video_path: str, output_path: str, 
                             grid_size: tuple = (3, 3), thumbnail_size: tuple = (160, 90)) -> Dict:
-        """创建视频缩略图网格"""
+        """创建视频缩略图网格（在CPU进程池中解码和拼接）"""
         try:
             if not os.path.exists(video_path):
                 raise Exception('视频文件不存在')
             
-            video = VideoFileClip(video_path)
-            duration = video.duration
-            
-            rows, cols = grid_size
-            total_thumbnails = rows * cols
-            
-            # 计算时间间隔
-            time_interval = duration / (total_thumbnails + 1)
-            
-            # 创建网格图像
-            grid_width = cols * thumbnail_size[0]
-            grid_height = rows * thumbnail_size[1]
-            grid_image = Image.new('RGB', (grid_width, grid_height), 'black')
-            
-            # 提取并放置缩略图
-            for i in range(total_thumbnails):
-                timestamp = time_interval * (i + 1)
-                
-                # 提取帧
-                frame = video.get_frame(timestamp)
-                thumbnail = Image.fromarray(frame)
-                thumbnail = thumbnail.resize(thumbnail_size, Image.Resampling.LANCZOS)
-                
-                # 计算位置
-                row = i // cols
-                col = i % cols
-                x = col * thumbnail_size[0]
-                y = row * thumbnail_size[1]
-                
-                # 粘贴到网格
-                grid_image.paste(thumbnail, (x, y))
-            
-            # 保存网格图像
-            grid_image.save(output_path, 'JPEG', quality=90)
-            
-            # 清理资源
-            video.close()
+            total_thumbnails = run_cpu(build_thumbnail_grid, video_path, output_path,
+                                       grid_size, thumbnail_size, 90)
             
             return {
                 'status': 'success',
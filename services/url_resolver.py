@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from config import Config
+from .executor import map_ordered
+from .http_client import get_http_session
+from .scheduler import PRIORITY_PROBE
+from .single_flight import SingleFlight
+
+# 需要跟随重定向才能得到视频地址的短链接域名
+SHORT_LINK_HOSTS = ('b23.tv', 'youtu.be', 'v.kuaishou.com', 'xhslink.com')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+def is_short_link(url: str) -> bool:
+    domain = urlparse(url).netloc.lower()
+    return any(domain == host or domain.endswith('.' + host) for host in SHORT_LINK_HOSTS)
+
+
+class UrlResolveCache:
+    """
+    短链接解析结果缓存（TTL + LRU）
+
+    重复提交的短链接直接返回缓存的目标地址；同一短链接的并发解析只发起一次请求。
+    解析失败不缓存，下次请求会重新解析。
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and entry[1] < time.time():
+                del self._entries[url]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, url: str, target: str):
+        with self._lock:
+            self._entries[url] = (target, time.time() + self.ttl)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def resolve(self, url: str, resolver: Callable[[str], Optional[str]]) -> Optional[str]:
+        """
+        返回短链接的目标地址
+
+        Args:
+            url: 短链接
+            resolver: 未命中缓存时调用 resolver(url) 发起请求，失败时返回None
+
+        Returns:
+            目标地址，解析失败时返回None
+        """
+        target = self.get(url)
+        if target is not None:
+            return target
+
+        target = self._single_flight.do(url, resolver, url)
+        if target:
+            self.put(url, target)
+        return target
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache: Optional[UrlResolveCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_url_resolve_cache() -> UrlResolveCache:
+    """获取全局共享的短链接解析缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UrlResolveCache(Config.URL_RESOLVE_CACHE_TTL, Config.URL_RESOLVE_CACHE_SIZE)
+    return _cache
+
+
+def follow_redirects(url: str) -> Optional[str]:
+    """跟随重定向得到最终地址，请求失败或状态码不是200时返回None"""
+    try:
+        response = get_http_session().head(url, allow_redirects=True, timeout=10, headers={'User-Agent': USER_AGENT})
+        if response.status_code == 200:
+            return response.url
+    except Exception:
+        pass
+    return None
+
+
+def resolve_short_url(url: str) -> Optional[str]:
+    """带缓存地解析短链接，失败时返回None"""
+    return get_url_resolve_cache().resolve(url, follow_redirects)
+
+
+def resolve_many(urls: Iterable[str]) -> Dict[str, Optional[str]]:
+    """以探测优先级并发解析一批链接中的短链接（重复的只解析一次），返回 {短链接: 目标地址}"""
+    short_urls = list(dict.fromkeys(url for url in urls if is_short_link(url)))
+    targets = map_ordered(resolve_short_url, short_urls, lambda url, e: None, priority=PRIORITY_PROBE)
+    return dict(zip(short_urls, targets))
@@ -1,11 +1,20 @@
 import os
-import requests
 import re
 from urllib.parse import urlparse
-import yt_dlp
-import subprocess
 import json
 from typing import List, Dict
+from config import Config
+from . import cancellation, progress
+from .executor import map_ordered
+from .media_cache import get_media_cache, media_cache_key
+from .metadata_cache import downloaded_filepath, extract_and_download, extract_info
+from .negative_cache import get_negative_cache
+from .platforms import detect_platform, canonical_key
+from .rate_limiter import get_rate_limiter
+from .single_flight import SingleFlight
+from .storage_manager import get_storage_manager
+from .url_resolver import resolve_many, resolve_short_url
+from .ytdlp_pool import get_ytdlp_pool
 from .kuaishou_downloader import KuaishouDownloader
 from .xiaohongshu_downloader import XiaohongshuDownloader
 
@@ -48,6 +57,7 @@ class VideoDownloader:
         # 使用固定的临时目录，而不是每次创建新的
         self.temp_dir = os.path.join(tempfile.gettempdir(), 'fastmedia_temp')
         os.makedirs(self.temp_dir, exist_ok=True)
+        get_storage_manager().add_directory(self.temp_dir, Config.TEMP_DIR_QUOTA_BYTES)
 
         self.download_dir = 'downloads/videos'  # 保留作为默认下载目录
         os.makedirs(self.download_dir, exist_ok=True)
@@ -55,6 +65,12 @@ class VideoDownloader:
         # 初始化快手和小红书下载器
         self.kuaishou_downloader = KuaishouDownloader(self.temp_dir)
         self.xiaohongshu_downloader = XiaohongshuDownloader(self.temp_dir)
+        self.media_cache = get_media_cache()
+
+        # 合并同一视频的并发下载请求
+        self.single_flight = SingleFlight()
+        self.negative_cache = get_negative_cache()
+        self.ydl_pool = get_ytdlp_pool()
 
         # yt-dlp基础配置
         self.ydl_opts = {
@@ -70,6 +86,8 @@ class VideoDownloader:
             'writeinfojson': False,
             'cookiefile': None,
             'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'progress_hooks': [progress.ytdlp_hook('download')],
+            **Config.YTDLP_RESUME_OPTS,
         }
 
     def get_bilibili_opts(self, base_opts: dict = None, download_mode: bool = True) -> dict:
@@ -101,30 +119,52 @@ class VideoDownloader:
 
         return bilibili_opts
     
+    @staticmethod
+    def _bilibili_error_message(error: Exception) -> str:
+        """把B站的yt-dlp错误转换为用户可读的提示"""
+        error_msg = str(error).lower()
+        print(f"B站下载错误详情: {str(error)}")
+
+        if 'json' in error_msg or 'parse' in error_msg:
+            return 'B站API限制：该视频暂时无法下载，请稍后重试或尝试其他视频'
+        elif 'region' in error_msg or 'geoblock' in error_msg:
+            return '该视频有地区限制，无法在当前地区下载'
+        elif 'private' in error_msg or 'permission' in error_msg:
+            return '该视频为私人视频或需要权限才能下载'
+        elif 'playlist' in error_msg:
+            return 'B站系列视频处理失败，请尝试视频的具体分集链接'
+        elif 'timeout' in error_msg or 'network' in error_msg:
+            return '网络超时，请检查网络连接后重试'
+        elif 'unavailable' in error_msg:
+            return '该视频不可用，可能已被删除或设为私密'
+        else:
+            return f'B站下载失败: {str(error)}'
+
     def download_batch(self, urls: List[str]) -> List[Dict]:
-        """批量下载视频"""
-        results = []
-        
-        for url in urls:
-            try:
-                result = self.download_single(url)
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'url': url,
-                    'status': 'error',
-                    'error': str(e),
-                    'filepath': None
-                })
-        
-        return results
+        """批量下载视频，在共享线程池中并发执行，结果顺序与输入一致"""
+        # 先并发解析批次中的短链接，各下载任务预处理URL时直接命中缓存
+        resolve_many(urls)
+        return map_ordered(self.download_single, urls, lambda url, e: {
+            'url': url,
+            'status': 'error',
+            'error': str(e),
+            'filepath': None
+        })
     
     def download_single(self, url: str) -> Dict:
+        """下载单个视频，同一视频的并发请求只执行一次下载并共享结果"""
+        # 预处理URL（处理短链接等）
+        processed_url = self.preprocess_url(url)
+        key = canonical_key(processed_url) or processed_url
+        # 已知失效的视频直接返回上次的错误
+        result = self.negative_cache.call(key, self.single_flight.do, ('download', key), self._download_single, url, processed_url)
+        # 返回副本，并保留各请求自己的原始URL
+        return dict(result, url=url)
+
+    def _download_single(self, url: str, processed_url: str) -> Dict:
         """下载单个视频"""
         try:
             debug_log(f"DEBUG: download_single called with URL: {url}")
-            # 预处理URL（处理短链接等）
-            processed_url = self.preprocess_url(url)
             debug_log(f"DEBUG: processed_url: {processed_url}")
 
             # 检测平台
@@ -134,11 +174,19 @@ class VideoDownloader:
             if platform == 'unsupported':
                 raise Exception(f'不支持的平台: {url}')
             elif platform == 'kuaishou':
-                # 使用专门的快手下载器
+                # 使用专门的快手下载器（内部自行限流）
                 return self.kuaishou_downloader.download_video(processed_url)
-            elif platform == 'xiaohongshu':
+
+            # 按平台限流，令牌不足时等待；yt-dlp平台先查媒体缓存，只在需要请求平台时获取令牌
+            rate_limiter = get_rate_limiter()
+            cancellation.check()
+
+            if platform == 'xiaohongshu':
                 # 使用专门的小红书下载器
-                return self.xiaohongshu_downloader.download_video(processed_url)
+                rate_limiter.acquire(platform)
+                result = self.xiaohongshu_downloader.download_video(processed_url)
+                rate_limiter.report_result(platform, result.get('error'))
+                return result
             
             # 根据平台调整配置
             if platform == 'bilibili':
@@ -152,49 +200,6 @@ class VideoDownloader:
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                     'Referer': 'https://www.tiktok.com/'
                 }
-            elif platform == 'kuaishou':
-                # 快手特殊配置
-                opts = self.ydl_opts.copy()
-                opts['format'] = 'best/worst'
-                opts['http_headers'] = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Referer': 'https://www.kuaishou.com/',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br'
-                }
-                opts['extractor_args'] = {
-                    'kuaishou': {
-                        'api_hostname': 'www.kuaishou.com'
-                    }
-                }
-                opts['cookiefile'] = None
-                opts['ignoreerrors'] = True
-            elif platform == 'xiaohongshu':
-                # 小红书特殊配置 - 增强版本，添加更多浏览器模拟头
-                opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'format': 'best/worst',
-                    'http_headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Referer': 'https://www.xiaohongshu.com/',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'Cache-Control': 'no-cache',
-                        'Pragma': 'no-cache',
-                        'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-                        'Sec-Ch-Ua-Mobile': '?0',
-                        'Sec-Ch-Ua-Platform': '"Windows"',
-                        'Sec-Fetch-Dest': 'document',
-                        'Sec-Fetch-Mode': 'navigate',
-                        'Sec-Fetch-Site': 'none',
-                        'Sec-Fetch-User': '?1',
-                        'Upgrade-Insecure-Requests': '1'
-                    }
-                }
-                debug_log(f"DEBUG: 小红书配置 - 使用增强的浏览器模拟配置: {opts}")
             else:
                 # 其他平台（YouTube等）使用默认配置，但需要处理文件名编码问题
                 opts = self.ydl_opts.copy()
@@ -206,116 +211,29 @@ class VideoDownloader:
                     opts['outtmpl'] = os.path.join(self.temp_dir, 'youtube-%(id)s-%(timestamp)s.%(ext)s')
                     debug_log(f"DEBUG: YouTube使用特殊文件名模板: {opts['outtmpl']}")
             
-            # 使用yt-dlp下载
+            # 使用yt-dlp下载（小红书和快手已在上面交给专门的下载器）
             try:
-                debug_log(f"DEBUG: 开始提取小红书视频信息 - URL: {processed_url}")
                 debug_log(f"DEBUG: 使用的yt-dlp配置: {opts}")
-
-                # 针对小红书使用与测试脚本完全相同的方式
-                if platform == 'xiaohongshu':
-                    debug_log(f"DEBUG: 使用与测试脚本完全相同的方式处理小红书")
-                    try:
-                        # 完全复制测试脚本的逻辑
-                        xiaohongshu_opts = {
-                            'quiet': True,
-                            'no_warnings': True,
-                            'format': 'best/worst',
-                            'http_headers': {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                                'Referer': 'https://www.xiaohongshu.com/',
-                                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                                'Accept-Encoding': 'gzip, deflate, br'
-                            }
-                        }
-
-                        debug_log(f"DEBUG: 小红书测试脚本配置: {xiaohongshu_opts}")
-
-                        with yt_dlp.YoutubeDL(xiaohongshu_opts) as ydl:
-                            debug_log(f"DEBUG: 开始使用与测试脚本相同的方式提取信息")
-                            info = ydl.extract_info(processed_url, download=False)
-                            debug_log(f"DEBUG: 小红书测试脚本方式获取到的信息: {info}")
-
-                        if info is None:
-                            debug_log(f"DEBUG: 小红书测试脚本方式返回None")
-                            raise Exception('无法获取视频信息，可能是网络问题或视频不存在')
-
-                    except Exception as e:
-                        debug_log(f"DEBUG: 小红书测试脚本方式失败: {str(e)}")
-                        raise Exception(f'小红书视频处理失败: {str(e)}')
-                else:
-                    # 其他平台使用原有的yt-dlp Python API
-                    debug_log(f"DEBUG: 即将创建YoutubeDL实例")
-                    with yt_dlp.YoutubeDL(opts) as ydl:
-                        debug_log(f"DEBUG: YoutubeDL实例创建成功，开始提取信息")
-                        # 获取视频信息
-                        info = ydl.extract_info(processed_url, download=False)
-                        debug_log(f"DEBUG: 提取到的视频信息: {info}")
-
-                        # 检查info是否为None
-                        if info is None:
-                            debug_log(f"DEBUG: 视频信息提取失败 - info为None")
-                            raise Exception('无法获取视频信息，可能是网络问题或视频不存在')
-
-                    # 下载视频
-                if platform == 'xiaohongshu':
-                    # 小红书使用subprocess下载
-                    debug_log(f"DEBUG: 使用subprocess下载小红书视频")
-                    download_opts = opts.copy()
-                    download_opts['outtmpl'] = os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s')
-
-                    # 构建下载命令
-                    cmd = [
-                        'python', '-m', 'yt_dlp',
-                        '--quiet', '--no-warnings',
-                        '--format', 'best/worst',
-                        '--output', os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s'),
-                        processed_url
-                    ]
-                    debug_log(f"DEBUG: 小红书下载命令: {' '.join(cmd)}")
-
-                    try:
-                        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                        debug_log(f"DEBUG: 小红书下载返回码: {result.returncode}")
-                        debug_log(f"DEBUG: 小红书下载输出: {result.stdout}")
-                        debug_log(f"DEBUG: 小红书下载错误: {result.stderr}")
-
-                        if result.returncode != 0:
-                            error_msg = result.stderr.strip() if result.stderr else '下载失败'
-                            raise Exception(f'小红书视频下载失败: {error_msg}')
-
-                        debug_log(f"DEBUG: 小红书视频下载完成")
-                    except subprocess.TimeoutExpired:
-                        raise Exception('小红书视频下载超时，请稍后重试')
-                else:
-                    # 其他平台的下载逻辑
-                    title = info.get('title', 'unknown')
-                    # 针对B站特殊处理
+                # 同一视频同一格式已下载过时直接使用媒体缓存中的文件，否则用同一次提取的信息直接下载
+                cache_format = opts.get('format')
+                try:
+                    with self.ydl_pool.checkout(opts) as ydl:
+                        info, cached = extract_and_download(
+                            ydl, processed_url, platform=platform,
+                            lookup=lambda info: self.media_cache.lookup(media_cache_key(platform, info, cache_format))
+                        )
+                except Exception as download_error:
                     if platform == 'bilibili':
-                        try:
-                            # 下载视频
-                            ydl.download([processed_url])
-                        except Exception as download_error:
-                            error_msg = str(download_error).lower()
-                            print(f"B站下载错误详情: {str(download_error)}")
-
-                            if 'json' in error_msg or 'parse' in error_msg:
-                                raise Exception('B站API限制：该视频暂时无法下载，请稍后重试或尝试其他视频')
-                            elif 'region' in error_msg or 'geoblock' in error_msg:
-                                raise Exception('该视频有地区限制，无法在当前地区下载')
-                            elif 'private' in error_msg or 'permission' in error_msg:
-                                raise Exception('该视频为私人视频或需要权限才能下载')
-                            elif 'playlist' in error_msg:
-                                raise Exception('B站系列视频处理失败，请尝试视频的具体分集链接')
-                            elif 'timeout' in error_msg or 'network' in error_msg:
-                                raise Exception('网络超时，请检查网络连接后重试')
-                            elif 'unavailable' in error_msg:
-                                raise Exception('该视频不可用，可能已被删除或设为私密')
-                            else:
-                                raise Exception(f'B站下载失败: {str(download_error)}')
-                    else:
-                        # 其他平台正常下载
-                        ydl.download([processed_url])
+                        raise Exception(self._bilibili_error_message(download_error))
+                    raise
+                debug_log(f"DEBUG: 提取到的视频信息: {info}")
+
+                # 检查info是否为None
+                if info is None:
+                    debug_log(f"DEBUG: 视频信息提取失败 - info为None")
+                    raise Exception('无法获取视频信息，可能是网络问题或视频不存在')
+                if cached is not None:
+                    debug_log(f"DEBUG: 命中媒体缓存: {processed_url}")
 
                 # 构建文件路径（包含平台信息）
                 extractor = info.get('extractor', platform.replace('/', '_'))
@@ -337,8 +255,16 @@ class VideoDownloader:
                     filename = f"{extractor}-{sanitize_filename(original_title)}.{info.get('ext', 'mp4')}"
                     download_filename = filename
 
-                # 实际下载的文件路径在临时目录中
-                actual_filepath = os.path.join(self.temp_dir, filename)
+                if cached is None:
+                    # 实际下载的文件路径以yt-dlp记录的为准（含合并后的扩展名）
+                    actual_filepath = downloaded_filepath(info)
+                    if actual_filepath is None:
+                        raise Exception('下载完成但未找到视频文件')
+                    cached = self.media_cache.store(media_cache_key(platform, info, cache_format), actual_filepath)
+                else:
+                    actual_filepath = os.path.join(self.temp_dir, filename)
+                    self.media_cache.materialize(cached, actual_filepath)
+                rate_limiter.report_success(platform)
 
                 return {
                     'url': url,  # 返回原始URL
@@ -349,6 +275,7 @@ class VideoDownloader:
                     'temp_filepath': actual_filepath,  # 临时文件路径
                     'download_filename': download_filename,  # 建议的文件名
                     'filesize': os.path.getsize(actual_filepath) if os.path.exists(actual_filepath) else 0,
+                    'sha256': cached['sha256'] if cached else None,  # 缓存中记录的内容哈希
                     'duration': info.get('duration', 0),
                     'uploader': info.get('uploader', '')
                 }
@@ -357,6 +284,7 @@ class VideoDownloader:
                 # 提供更友好的错误信息
                 error_msg = str(e)
                 debug_log(f"DEBUG: yt-dlp异常: {error_msg}")
+                rate_limiter.report_result(platform, error_msg)
                 if 'NoneType' in error_msg and 'get' in error_msg:
                     raise Exception('B站视频信息获取失败，可能是网络问题或B站API限制')
                 elif '无法获取视频信息' in error_msg:
@@ -394,22 +322,7 @@ class VideoDownloader:
 
     def detect_platform(self, url: str) -> str:
         """检测视频平台"""
-        domain = urlparse(url).netloc.lower()
-
-        if 'douyin.com' in domain or 'tiktok.com' in domain:
-            return 'douyin/tiktok'
-        elif 'bilibili.com' in domain or 'b23.tv' in domain:
-            return 'bilibili'
-        elif 'youtube.com' in domain or 'youtu.be' in domain:
-            return 'youtube'
-        elif 'twitter.com' in domain or 'x.com' in domain:
-            return 'twitter'
-        elif 'kuaishou.com' in domain:
-            return 'kuaishou'
-        elif 'xiaohongshu.com' in domain or 'xhslink.com' in domain:
-            return 'xiaohongshu'
-        else:
-            return 'unsupported'
+        return detect_platform(url)
 
     def preprocess_url(self, url: str) -> str:
         """预处理URL，处理短链接重定向和清理参数等"""
@@ -418,7 +331,6 @@ class VideoDownloader:
             cleaned_url = url
 
             # 移除常见的分享文本前缀
-            import re
             # 匹配类似 "4 【AUG自述 - 武器大师 | 小红书 - 你的生活兴趣社区】 😆 HIbzka9uzjpGbxB 😆 https://www.xiaohongshu.com/..."
             pattern = r'.*?(https?://[^\s]+)'
             match = re.search(pattern, url)
@@ -427,6 +339,13 @@ class VideoDownloader:
 
             parsed = urlparse(cleaned_url)
 
+            # 小红书短链接先解析为完整链接，再按下面的规则保留访问参数
+            if 'xhslink.com' in parsed.netloc.lower():
+                target = resolve_short_url(cleaned_url)
+                if target and 'xiaohongshu.com' in target:
+                    cleaned_url = target
+                    parsed = urlparse(cleaned_url)
+
             # 处理B站链接
             if 'bilibili.com' in parsed.netloc.lower() or 'b23.tv' in parsed.netloc.lower():
                 # 清理B站URL，移除不必要的跟踪参数
@@ -445,27 +364,19 @@ class VideoDownloader:
                     query_string = "&".join([f"{k}={v}" for k, v in query_params.items()])
                     clean_url += f"?{query_string}"
 
-                # 处理短链接重定向
+                # 处理短链接重定向（解析结果有缓存）
                 if 'b23.tv' in parsed.netloc.lower():
-                    try:
-                        response = requests.head(url, allow_redirects=True, timeout=10,
-                                               headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
-                        if response.status_code == 200 and 'bilibili.com' in response.url:
-                            return response.url
-                    except Exception:
-                        pass
+                    target = resolve_short_url(cleaned_url)
+                    if target and 'bilibili.com' in target:
+                        return target
 
                 return clean_url
 
             # 处理YouTube短链接
             elif 'youtu.be' in parsed.netloc.lower():
-                try:
-                    response = requests.head(url, allow_redirects=True, timeout=10,
-                                           headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
-                    if response.status_code == 200:
-                        return response.url
-                except Exception:
-                    pass
+                target = resolve_short_url(cleaned_url)
+                if target:
+                    return target
 
             # 处理小红书链接，保留必要的访问参数
             elif 'xiaohongshu.com' in parsed.netloc.lower():
@@ -501,22 +412,23 @@ class VideoDownloader:
             processed_url = self.preprocess_url(url)
             platform = self.detect_platform(processed_url)
 
+            # 命中缓存时不请求平台，也不占用限流令牌
             # 针对B站使用特殊配置
             if platform == 'bilibili':
                 opts = self.get_bilibili_opts({'quiet': True}, download_mode=False)
                 try:
-                    with yt_dlp.YoutubeDL(opts) as ydl:
-                        info = ydl.extract_info(processed_url, download=False)
+                    with self.ydl_pool.checkout(opts) as ydl:
+                        info = extract_info(ydl, processed_url, platform)
                 except Exception as e:
                     # 如果失败，尝试使用更宽松的配置
                     print(f"B站信息获取失败，尝试宽松配置: {str(e)}")
                     relaxed_opts = self.get_bilibili_opts({'quiet': False, 'ignoreerrors': True}, download_mode=False)
-                    with yt_dlp.YoutubeDL(relaxed_opts) as ydl:
-                        info = ydl.extract_info(processed_url, download=False)
+                    with self.ydl_pool.checkout(relaxed_opts) as ydl:
+                        info = extract_info(ydl, processed_url, platform)
             else:
                 # 其他平台使用默认配置
-                with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                    info = ydl.extract_info(processed_url, download=False)
+                with self.ydl_pool.checkout({'quiet': True}) as ydl:
+                    info = extract_info(ydl, processed_url, platform)
 
             if info is None:
                 raise Exception('无法获取视频信息')
@@ -0,0 +1,74 @@
+import os
+import socket
+import threading
+import uuid
+from typing import Dict, Optional
+
+from loguru import logger
+
+from . import progress
+from .job_manager import JobManager
+
+
+class Worker:
+    """
+    从共享任务队列认领并执行子项的worker
+
+    concurrency 个线程各自循环认领子项；主线程定期续约，并把API进程写入的取消请求
+    转交给正在执行的子项。下载进度写回队列表，由API进程推送给前端。
+    """
+
+    def __init__(self, job_manager: JobManager, concurrency: int, worker_id: Optional[str] = None,
+                 poll_interval: float = 1.0):
+        if not job_manager.queue.remote:
+            raise ValueError('worker 需要共享任务队列，请设置 JOB_QUEUE_BACKEND=sqlite')
+        self.job_manager = job_manager
+        self.queue = job_manager.queue
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def run(self):
+        """启动工作线程并阻塞，直到 stop() 或 Ctrl+C"""
+        progress.get_progress_broker().add_listener(self._relay_progress)
+        for i in range(self.concurrency):
+            threading.Thread(target=self._loop, name=f'fastmedia-worker-{i}', daemon=True).start()
+        logger.info(f"worker已启动: {self.worker_id} (并发 {self.concurrency})")
+
+        heartbeat_interval = self.queue.lease_seconds / 3
+        try:
+            while not self._stop.is_set():
+                self.queue.heartbeat(self.worker_id)
+                for job_id, index in self.queue.cancel_requests(self.worker_id):
+                    self.job_manager.cancel_local(job_id, index)
+                self._stop.wait(min(heartbeat_interval, self.poll_interval))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            # 归还未完成的子项，其他worker可以立即认领
+            self.queue.release(self.worker_id)
+            logger.info(f"worker已停止: {self.worker_id}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            claim = self.queue.claim(self.worker_id)
+            if claim is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            job_id, index = claim['job_id'], claim['idx']
+            try:
+                self.job_manager.run_claimed(job_id, index, bool(claim['cancel_requested']))
+            except Exception as e:
+                logger.error(f"子项执行异常 {job_id}[{index}]: {e}")
+            finally:
+                self.queue.done(job_id, index)
+
+    def _relay_progress(self, job_id: str, event: Dict):
+        if event.get('type') == 'progress':
+            self.queue.update_progress(job_id, event['index'], event)
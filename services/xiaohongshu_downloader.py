@@ -1,11 +1,15 @@
 import re
 import requests
-import yt_dlp
 import json
 from urllib.parse import urlparse, parse_qs
 from typing import Dict, Optional
 import tempfile
 import os
+from config import Config
+from . import progress
+from .metadata_cache import downloaded_filepath, extract_and_download
+from .storage_manager import get_storage_manager
+from .ytdlp_pool import get_ytdlp_pool
 
 class XiaohongshuDownloader:
     def __init__(self, temp_dir: str = None):
@@ -15,6 +19,40 @@ class XiaohongshuDownloader:
             temp_dir = os.path.join(tempfile.gettempdir(), 'fastmedia_xiaohongshu_temp')
         self.temp_dir = temp_dir
         os.makedirs(temp_dir, exist_ok=True)
+        get_storage_manager().add_directory(self.temp_dir, Config.TEMP_DIR_QUOTA_BYTES)
+        self.ydl_pool = get_ytdlp_pool()
+
+        # 标准方法的yt-dlp配置，与测试脚本完全相同
+        self.standard_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'format': 'best/worst',
+            'outtmpl': os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s'),
+            'progress_hooks': [progress.ytdlp_hook('download')],
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Referer': 'https://www.xiaohongshu.com/',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br'
+            }
+        }
+
+        # 备用方法：只选择最佳格式，使用移动端UA
+        self.alternative_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'format': 'best',  # 只选择最佳格式
+            'outtmpl': os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s'),
+            'progress_hooks': [progress.ytdlp_hook('download')],
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+                'Referer': 'https://www.xiaohongshu.com/',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br'
+            }
+        }
 
     def clean_url(self, url: str) -> str:
         """清理小红书URL，保留必要的访问参数"""
@@ -78,7 +116,8 @@ class XiaohongshuDownloader:
             extractor = info.get('extractor', 'XiaoHongShu')
             title = info.get('title', 'XiaoHongShu_video')
             filename = f"{extractor}-{title}.mp4"
-            actual_filepath = os.path.join(self.temp_dir, filename)
+            # 实际文件路径以yt-dlp记录的为准
+            actual_filepath = downloaded_filepath(info) or os.path.join(self.temp_dir, filename)
 
             return {
                 'url': url,
@@ -106,30 +145,11 @@ class XiaohongshuDownloader:
         try:
             print("尝试标准yt-dlp方法...")
 
-            # 使用与测试脚本完全相同的配置
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'format': 'best/worst',
-                'outtmpl': os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s'),
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Referer': 'https://www.xiaohongshu.com/',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br'
-                }
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # 先获取信息
-                info = ydl.extract_info(url, download=False)
+            with self.ydl_pool.checkout(self.standard_opts) as ydl:
+                # 提取信息后直接用同一份信息下载
+                info, _ = extract_and_download(ydl, url)
                 if info:
-                    print(f"成功获取视频信息: {info.get('title', 'N/A')}")
-
-                    # 然后下载
-                    ydl.download([url])
-                    print("视频下载完成")
+                    print(f"视频下载完成: {info.get('title', 'N/A')}")
                     return info
                 else:
                     print("无法获取视频信息")
@@ -145,26 +165,10 @@ class XiaohongshuDownloader:
             print("尝试备用下载方法...")
 
             # 尝试不同的格式选择
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'format': 'best',  # 只选择最佳格式
-                'outtmpl': os.path.join(self.temp_dir, '%(extractor)s-%(title)s.%(ext)s'),
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-                    'Referer': 'https://www.xiaohongshu.com/',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br'
-                }
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+            with self.ydl_pool.checkout(self.alternative_opts) as ydl:
+                info, _ = extract_and_download(ydl, url)
                 if info:
-                    print(f"备用方法成功获取视频信息: {info.get('title', 'N/A')}")
-                    ydl.download([url])
-                    print("备用方法视频下载完成")
+                    print(f"备用方法视频下载完成: {info.get('title', 'N/A')}")
                     return info
                 else:
                     print("备用方法无法获取视频信息")
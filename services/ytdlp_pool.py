@@ -0,0 +1,106 @@
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import yt_dlp
+from loguru import logger
+
+from config import Config
+
+
+def profile_key(opts: Dict) -> str:
+    """
+    配置的指纹，内容相同的配置属于同一个profile
+
+    progress_hooks 等回调按对象区分，调用方应在初始化时生成一次配置并重复使用，而不是每次调用新建。
+    """
+    return json.dumps(opts, sort_keys=True, default=repr)
+
+
+class YoutubeDLPool:
+    """
+    按配置复用 YoutubeDL 实例
+
+    创建 YoutubeDL 需要初始化提取器、加载cookie并建立请求会话。池按配置（profile，如B站下载、
+    TikTok下载、音频提取）分组保存空闲实例，任务通过 checkout() 借出后独占使用，用完放回，
+    提取器实例、cookie和连接在同一profile的任务之间复用。
+
+    使用中抛出yt-dlp以外的异常时实例直接关闭，不放回池中；每个实例使用 max_uses 次后重建，
+    避免长期累积的状态。
+    """
+
+    def __init__(self, max_idle: int = 4, max_uses: int = 100):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._idle: Dict[str, List[Tuple[yt_dlp.YoutubeDL, int]]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def checkout(self, opts: Dict) -> Iterator[yt_dlp.YoutubeDL]:
+        """借出一个使用 opts 配置的实例，退出上下文时归还"""
+        key = profile_key(opts)
+        ydl, uses = self._acquire(key, opts)
+        try:
+            yield ydl
+        except yt_dlp.utils.YoutubeDLError:
+            # 视频不可用、任务取消等情况实例本身仍然可用
+            self._release(key, ydl, uses + 1)
+            raise
+        except BaseException:
+            self._close(ydl)
+            raise
+        else:
+            self._release(key, ydl, uses + 1)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'profiles': len(self._idle),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'created': self.created,
+                'reused': self.reused
+            }
+
+    def _acquire(self, key: str, opts: Dict) -> Tuple[yt_dlp.YoutubeDL, int]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.created += 1
+        return yt_dlp.YoutubeDL(opts), 0
+
+    def _release(self, key: str, ydl: yt_dlp.YoutubeDL, uses: int):
+        # 清除上一个任务的错误状态，避免影响下一个任务的返回码
+        ydl._download_retcode = 0
+        if uses < self.max_uses:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append((ydl, uses))
+                    return
+        self._close(ydl)
+
+    @staticmethod
+    def _close(ydl: yt_dlp.YoutubeDL):
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.debug(f"关闭YoutubeDL实例失败: {e}")
+
+
+_pool: Optional[YoutubeDLPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ytdlp_pool() -> YoutubeDLPool:
+    """获取全局共享的 YoutubeDL 实例池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = YoutubeDLPool(Config.YTDLP_POOL_MAX_IDLE, Config.YTDLP_POOL_MAX_USES)
+    return _pool
@@ -0,0 +1,81 @@
+import os
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+from loguru import logger
+
+# 从磁盘读取产物文件的块大小
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipSink:
+    """
+    只写、不可定位的输出，供 ZipFile 写入
+
+    没有 tell/seek 时 ZipFile 按流式模式写入：每个条目在数据之后用数据描述符记录CRC和大小，
+    不需要回头修改本地文件头。写入的数据由生成器随时取走，内存中只保留一个块。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def unique_arcnames(entries: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """为 (文件路径, 文件名) 生成压缩包内不重复的名称，重名时追加 (1)、(2)…"""
+    used = set()
+    result = []
+    for path, name in entries:
+        name = (name or os.path.basename(path)).replace('/', '_').replace('\\', '_')
+        stem, ext = os.path.splitext(name)
+        arcname = name
+        counter = 1
+        while arcname.lower() in used:
+            arcname = f"{stem} ({counter}){ext}"
+            counter += 1
+        used.add(arcname.lower())
+        result.append((path, arcname))
+    return result
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    逐块生成包含 entries 中各文件的ZIP数据
+
+    条目使用 ZIP_STORED 存储，视频、音频和图片本身已经压缩，不再重复压缩；
+    整个压缩包既不在内存中组装也不写入磁盘，边读文件边输出。生成器提前关闭（客户端断开）时停止读取。
+
+    Args:
+        entries: (文件路径, 压缩包内名称) 列表，读取时已不存在的文件会被跳过
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for path, arcname in entries:
+            try:
+                # 预先填入文件大小，超过4GB的条目会按ZIP64写入
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                src = open(path, 'rb')
+            except OSError as e:
+                logger.warning(f"打包时跳过文件 {path}: {e}")
+                continue
+            info.compress_type = zipfile.ZIP_STORED
+            with src, archive.open(info, mode='w') as dst:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
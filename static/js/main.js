@@ -1,11 +1,19 @@
 // 全局变量
 let currentFeature = null;
+let currentJobId = null;
 
 // 页面加载完成后初始化
 document.addEventListener('DOMContentLoaded', function() {
     initializeEventListeners();
 });
 
+// 关闭或离开页面时取消未完成的任务，释放服务端的下载和处理资源
+window.addEventListener('pagehide', function() {
+    if (currentJobId && navigator.sendBeacon) {
+        navigator.sendBeacon(`/api/jobs/${currentJobId}/cancel`);
+    }
+});
+
 // 初始化事件监听器
 function initializeEventListeners() {
     // 功能卡片点击事件
@@ -142,8 +150,12 @@ async function processSelectedFeature() {
             throw new Error(data.error || '请求失败');
         }
 
+        // 等待后台任务完成
+        document.getElementById('loading').dataset.total = data.total;
+        const results = await waitForJob(data.job_id);
+
         // 显示结果
-        displayResults(data.results, currentFeature);
+        displayResults(results, currentFeature, data.job_id);
         showAlert('处理完成！', 'success');
 
     } catch (error) {
@@ -206,8 +218,12 @@ async function processVideos(type) {
             throw new Error(data.error || '请求失败');
         }
 
+        // 等待后台任务完成
+        document.getElementById('loading').dataset.total = data.total;
+        const results = await waitForJob(data.job_id);
+
         // 显示结果
-        displayResults(data.results, type);
+        displayResults(results, type, data.job_id);
         showAlert('处理完成！', 'success');
 
     } catch (error) {
@@ -218,8 +234,98 @@ async function processVideos(type) {
     }
 }
 
+// 等待任务完成并返回结果列表：优先通过SSE接收实时进度，不支持时退回轮询
+async function waitForJob(jobId) {
+    currentJobId = jobId;
+    try {
+        if (window.EventSource) {
+            try {
+                await watchJobEvents(jobId);
+            } catch (error) {
+                console.warn('进度推送中断，改为轮询:', error);
+            }
+        }
+        return await pollJobResult(jobId);
+    } finally {
+        currentJobId = null;
+    }
+}
+
+// 订阅任务进度事件，任务结束时resolve
+function watchJobEvents(jobId) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        const items = {};
+
+        const handleItem = (event) => {
+            const data = JSON.parse(event.data);
+            items[data.index] = Object.assign(items[data.index] || {}, data);
+            updateProgress(items);
+        };
+
+        source.addEventListener('progress', handleItem);
+        source.addEventListener('item', handleItem);
+        source.addEventListener('done', (event) => {
+            source.close();
+            resolve(JSON.parse(event.data).job);
+        });
+        source.onerror = () => {
+            source.close();
+            reject(new Error('SSE连接失败'));
+        };
+    });
+}
+
+// 根据每个URL的进度更新进度条和状态文字
+function updateProgress(items) {
+    const entries = Object.values(items);
+    if (entries.length === 0) return;
+
+    let fraction = 0;
+    let speed = 0;
+    let finished = 0;
+    entries.forEach(item => {
+        if (['success', 'error', 'cancelled'].includes(item.item_status)) {
+            fraction += 1;
+            finished += 1;
+        } else if (item.total_bytes) {
+            fraction += Math.min(item.downloaded_bytes / item.total_bytes, 1);
+        }
+        if (item.status === 'running' && item.speed) {
+            speed += item.speed;
+        }
+    });
+
+    const total = parseInt(document.getElementById('loading').dataset.total, 10) || entries.length;
+    const percent = Math.min(fraction / total * 100, 99);
+    document.getElementById('progress-fill').style.width = percent + '%';
+
+    let text = `处理中，已完成 ${finished}/${total}`;
+    if (speed > 0) {
+        text += ` · ${formatFileSize(speed)}/s`;
+    }
+    document.getElementById('loading-text').textContent = text;
+}
+
+// 轮询任务结果
+async function pollJobResult(jobId, interval = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}/result`);
+        const data = await response.json();
+
+        if (response.status === 200) {
+            return data.results;
+        }
+        if (response.status !== 202) {
+            throw new Error(data.error || '获取任务结果失败');
+        }
+
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 显示结果
-function displayResults(results, type) {
+function displayResults(results, type, jobId) {
     const resultsContent = document.getElementById('results-content');
     const resultsSection = document.getElementById('results');
     
@@ -481,7 +587,7 @@ function displayResults(results, type) {
         
         // 添加点击事件
         batchDownloadBtn.addEventListener('click', function() {
-            showBatchSaveDialog(successResults);
+            showBatchSaveDialog(successResults, jobId);
         });
         
         batchDownloadContainer.appendChild(batchDownloadBtn);
@@ -519,29 +625,18 @@ function getFileName(filepath) {
 
 // 显示加载状态
 function showLoading() {
-    document.getElementById('loading').classList.add('active');
-    
-    // 模拟进度条
-    const progressFill = document.getElementById('progress-fill');
-    let progress = 0;
-    const interval = setInterval(() => {
-        progress += Math.random() * 15;
-        if (progress > 90) progress = 90;
-        progressFill.style.width = progress + '%';
-    }, 500);
-    
-    // 存储interval ID以便后续清除
-    document.getElementById('loading').dataset.interval = interval;
+    const loading = document.getElementById('loading');
+    loading.classList.add('active');
+    loading.dataset.total = '';
+
+    // 进度由任务进度事件驱动
+    document.getElementById('progress-fill').style.width = '0%';
+    document.getElementById('loading-text').textContent = '处理中，请稍候...';
 }
 
 // 隐藏加载状态
 function hideLoading() {
     const loading = document.getElementById('loading');
-    const interval = loading.dataset.interval;
-    
-    if (interval) {
-        clearInterval(interval);
-    }
     
     // 完成进度条
     document.getElementById('progress-fill').style.width = '100%';
@@ -722,7 +817,7 @@ function downloadFile(filepath) {
 }
 
 // 显示批量另存为对话框
-function showBatchSaveDialog(successResults) {
+function showBatchSaveDialog(successResults, jobId) {
     // 创建模态对话框
     const modal = document.createElement('div');
     modal.style.cssText = `
@@ -768,7 +863,9 @@ function showBatchSaveDialog(successResults) {
         color: #6b7280;
         line-height: 1.5;
     `;
-    description.textContent = `即将下载 ${successResults.length} 个文件。由于浏览器安全限制，系统将逐个打开下载链接，请在浏览器中选择保存位置。`;
+    description.textContent = jobId
+        ? `即将把 ${successResults.length} 个文件打包为一个ZIP下载，请在浏览器中选择保存位置。`
+        : `即将下载 ${successResults.length} 个文件。由于浏览器安全限制，系统将逐个打开下载链接，请在浏览器中选择保存位置。`;
     
     // 文件列表
     const fileList = document.createElement('div');
@@ -846,7 +943,11 @@ function showBatchSaveDialog(successResults) {
     confirmBtn.textContent = '开始下载';
     confirmBtn.addEventListener('click', () => {
         document.body.removeChild(modal);
-        startBatchDownload(successResults);
+        if (jobId) {
+            downloadJobArchive(jobId);
+        } else {
+            startBatchDownload(successResults);
+        }
     });
     
     buttonArea.appendChild(cancelBtn);
@@ -869,6 +970,17 @@ function showBatchSaveDialog(successResults) {
     document.body.appendChild(modal);
 }
 
+// 打包下载任务的全部文件，服务端边读边生成ZIP
+function downloadJobArchive(jobId) {
+    const link = document.createElement('a');
+    link.href = `/api/jobs/${jobId}/archive`;
+    link.download = '';
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    showAlert('开始打包下载，请检查浏览器下载', 'success');
+}
+
 // 开始批量下载
 async function startBatchDownload(successResults) {
     showAlert('开始批量下载，文件将逐个下载到您选择的位置', 'success');
@@ -0,0 +1,61 @@
+import unittest
+
+from services.cancellation import JobCancelled
+from services.negative_cache import NegativeCache, classify_failure
+
+
+class ClassifyFailureTest(unittest.TestCase):
+    """使用yt-dlp实际输出的错误信息检查失败原因分类"""
+
+    def check_reason(self, reason, message):
+        self.assertEqual(classify_failure(message), reason, message)
+
+    def test_deleted(self):
+        self.check_reason('deleted', 'ERROR: [youtube] dQw4w9WgXcQ: Video unavailable')
+        self.check_reason('deleted', 'ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. '
+                                         'This video has been removed by the uploader')
+        self.check_reason('deleted', 'ERROR: [generic] Unable to download webpage: HTTP Error 404: Not Found '
+                                         '(caused by <HTTPError 404: Not Found>)')
+
+    def test_private(self):
+        self.check_reason('private', "ERROR: [youtube] dQw4w9WgXcQ: Private video. "
+                                         "Sign in if you've been granted access to this video")
+
+    def test_region(self):
+        self.check_reason('region', 'ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. '
+                                        'The uploader has not made this video available in your country')
+        self.check_reason('region', 'ERROR: [BiliBili] BV1xx411c7mD: This video may be deleted or geo-restricted. '
+                                        'You might want to try a VPN or a proxy server (with --proxy)')
+        self.check_reason('region', 'ERROR: [niconico] sm9: This video is not available from your location '
+                                        'due to geo restriction')
+
+    def test_unsupported(self):
+        self.check_reason('unsupported', 'ERROR: Unsupported URL: https://example.com/watch')
+
+    def test_transient(self):
+        self.check_reason(None, "ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. "
+                                    "This content isn't available, try again later.")
+        self.check_reason(None, 'ERROR: [TikTok] 7123456789: Unable to extract region info; '
+                                    'please report this issue on  https://github.com/yt-dlp/yt-dlp/issues')
+        self.check_reason(None, "ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you're not a bot. "
+                                    "Use --cookies-from-browser or --cookies for the authentication.")
+        self.check_reason(None, 'ERROR: [Instagram] C0abc: Requested content is not available, '
+                                    'rate-limit reached or login required. Use --cookies')
+        self.check_reason(None, 'ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: '
+                                    'HTTP Error 429: Too Many Requests')
+        self.check_reason(None, 'ERROR: [douyin] 7123: Unable to download webpage: <urlopen error timed out>')
+        self.check_reason(None, JobCancelled())
+
+
+class NegativeCacheTest(unittest.TestCase):
+
+    def test_records_only_deterministic_failures(self):
+        cache = NegativeCache({'deleted': 60, 'region': 60})
+        self.assertEqual(cache.record('bilibili:BV1', 'ERROR: [youtube] x: Video unavailable'), 'deleted')
+        self.assertIsNone(cache.record('youtube:x', "Video unavailable. This content isn't available, try again later"))
+        self.assertEqual(cache.get('bilibili:BV1')['reason'], 'deleted')
+        self.assertIsNone(cache.get('youtube:x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,12 @@
 # -*- coding: utf-8 -*-
 """
 FastMedia 工具函数模块
-包含日志设置和文件清理等功能
+包含日志设置和文件工具函数
 """
 
 import os
 import logging
-import time
 from pathlib import Path
-from datetime import datetime, timedelta
 
 def setup_logging(log_level='INFO', log_file=None):
     """
@@ -50,48 +48,6 @@ def setup_logging(log_level='INFO', log_file=None):
     if log_file:
         logging.info(f"日志文件: {log_file}")
 
-def clean_old_files(directory, max_age_days=7):
-    """
-    清理指定目录中超过指定天数的旧文件
-    
-    Args:
-        directory: 要清理的目录路径
-        max_age_days: 最大保留天数，默认为7天
-    """
-    if not os.path.exists(directory):
-        logging.warning(f"目录不存在: {directory}")
-        return
-    
-    current_time = time.time()
-    max_age_seconds = max_age_days * 24 * 60 * 60
-    removed_count = 0
-    total_size = 0
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                # 获取文件修改时间
-                file_mtime = os.path.getmtime(file_path)
-                file_age = current_time - file_mtime
-                
-                if file_age > max_age_seconds:
-                    # 删除旧文件
-                    file_size = os.path.getsize(file_path)
-                    os.remove(file_path)
-                    removed_count += 1
-                    total_size += file_size
-                    logging.debug(f"已删除旧文件: {file_path} (年龄: {file_age/86400:.1f}天)")
-                    
-            except (OSError, PermissionError) as e:
-                logging.warning(f"无法删除文件 {file_path}: {e}")
-    
-    if removed_count > 0:
-        size_mb = total_size / (1024 * 1024)
-        logging.info(f"清理完成: 删除了 {removed_count} 个文件，释放 {size_mb:.2f} MB 空间")
-    else:
-        logging.info(f"目录 {directory} 中没有需要清理的旧文件")
-
 def create_directories(directories):
     """
     创建必要的目录
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FastMedia 任务worker
+
+从共享任务队列认领下载/BGM/封面任务并执行，可在同一台机器上启动多个进程，
+与一个API进程（python run.py）配合使用，API进程和worker需使用同一个任务数据库。
+
+仅支持单机多进程：SQLite（WAL模式）不能放在网络文件系统上供多台机器共享，
+且下载产物保存在worker本机的临时目录中，由API进程直接读取发送。
+
+使用方法:
+    JOB_QUEUE_BACKEND=sqlite python run.py            # API进程只负责入队
+    JOB_QUEUE_BACKEND=sqlite python worker.py         # 启动worker
+    JOB_QUEUE_BACKEND=sqlite python worker.py --concurrency 8   # 指定并发数
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from config import Config
+from utils import setup_logging
+from services.job_handlers import register_media_handlers
+from services.job_manager import JobManager
+from services.job_queue import create_job_queue
+from services.job_store import JobStore
+from services.storage_manager import get_storage_manager
+from services.worker import Worker
+from services.video_downloader import VideoDownloader
+from services.bgm_extractor import BGMExtractor
+from services.thumbnail_extractor import ThumbnailExtractor
+
+def parse_arguments():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='FastMedia 任务worker')
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=Config.MAX_CONCURRENT_DOWNLOADS,
+        help=f'同时执行的子任务数 (默认: {Config.MAX_CONCURRENT_DOWNLOADS})'
+    )
+
+    parser.add_argument(
+        '--worker-id',
+        default=None,
+        help='worker标识 (默认: 主机名-进程号)'
+    )
+
+    parser.add_argument(
+        '--db',
+        default=Config.JOB_DB_PATH,
+        help=f'任务数据库路径 (默认: {Config.JOB_DB_PATH})'
+    )
+
+    parser.add_argument(
+        '--log-level',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='INFO',
+        help='日志级别 (默认: INFO)'
+    )
+
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_arguments()
+    setup_logging(log_level=args.log_level)
+
+    backend = Config.JOB_QUEUE_BACKEND
+    if backend == 'local':
+        print("❌ worker 需要共享任务队列，请设置 JOB_QUEUE_BACKEND=sqlite")
+        sys.exit(1)
+
+    job_queue = create_job_queue(
+        backend, args.db,
+        lease_seconds=Config.WORKER_LEASE_SECONDS, aging_seconds=Config.PRIORITY_AGING_SECONDS
+    )
+    job_manager = JobManager(JobStore(args.db), job_queue, retention_seconds=Config.JOB_RETENTION_SECONDS)
+    register_media_handlers(job_manager, VideoDownloader(), BGMExtractor(), ThumbnailExtractor())
+    get_storage_manager().start()
+
+    print(f"FastMedia worker 已启动，任务数据库: {args.db}，按 Ctrl+C 停止")
+    Worker(job_manager, args.concurrency, worker_id=args.worker_id).run()
+    print("\n👋 worker已停止")
+
+if __name__ == '__main__':
+    main()